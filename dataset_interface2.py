@@ -9,10 +9,8 @@ st.set_page_config(page_title="Ill-Co Tagging", layout="wide", initial_sidebar_s
 # Now proceed with other imports
 import os
 import json
-import random
-import time
 import openai
-from learning_app.utils.config import load_environment, get_openai_api_key
+from learning_app.utils.config import ensure_environment, get_openai_api_key
 
 # Import constants from the constants file
 try:
@@ -26,26 +24,35 @@ except (ModuleNotFoundError, ImportError, SyntaxError) as e:
 IS_DEV = False  # Set to False for production
 
 # Load .env from absolute path FIRST - before any firebase imports
-# Ensure environment is loaded
-load_environment()
+# Ensure environment is loaded (only the first run in the process does any work)
+ensure_environment()
 
 # Print environment variables for debugging (remove in production)
 print(f"FIREBASE_ADMIN_CREDENTIAL_PATH: {os.getenv('FIREBASE_ADMIN_CREDENTIAL_PATH')}")
 print(f"FIREBASE_DATABASE_URL: {os.getenv('FIREBASE_DATABASE_URL')}")
 
-# NOW import Firebase-related modules after environment is loaded
-from learning_app.utils.firebase_service import save_tag_to_firebase as save_tags_to_firebase, get_user_tags
-from learning_app.utils.firebase_service import get_all_tag_counts, get_user_tag_count
-# Print environment variables for debugging in development mode only
 # NOW import Firebase-related modules after environment is loaded
 from learning_app.utils.firebase_service import (
     save_tag_to_firebase as save_tags_to_firebase, 
     get_user_tags,
     get_all_tag_counts, 
     get_user_tag_count,
-    create_user,
-    login_user
+    flush_tag_writes,
+    get_queue_cursor,
+    save_queue_cursor,
+    get_image_tag_counts,
+    list_user_tagged_image_ids
 )
+# Account helpers live in auth (firebase_service never defined them)
+from learning_app.scripts.auth import create_user, login_user
+# The tagging and download UI (previously imported from a non-existent ui_components module)
+from learning_app.scripts.image_tagging_ui import render_download_ui, render_tagging_ui
+from learning_app.utils.blocklist import get_blocklist
+from learning_app.utils.image_ids import get_image_id
+from learning_app.utils.pair_records import MappedPairs, freeze_items, open_pairs
+from learning_app.utils.pair_schema import canonical_pair
+from learning_app.utils.permutation import user_order
+from learning_app.utils.assignment import get_assignment_service
 # Add after your imports but before sidebar code
 def create_account(email, password, display_name):
     """Centralized account creation function with validation"""
@@ -113,76 +120,52 @@ def enable_dev_mode(email=None, display_name=None):
     return dev_user
 
 # === Data Loading Function ===
-@st.cache_data(ttl=3600)  # Cache for 1 hour max
+# cache_resource, not cache_data: the dataset is loaded once per process as
+# read-only PairRecords shared by every session, never pickled or copied per
+# session; a session only keeps its own permutation and cursor
+@st.cache_resource(ttl=3600)  # Re-check the source file at most once an hour
 def load_image_pairs():
     # Use the absolute path to the file
     base_dir = os.path.dirname(__file__)
     SAMPLE_PATH = "learning_app/output/pairs/combined_pairs_sampled_for_gpt.json"
     file_path = os.path.join(base_dir, SAMPLE_PATH)
-    
-    try:
-        with open(file_path, "r") as f:
-            data = json.load(f)
-        print(f"✅ Successfully loaded {len(data)} image pairs from {file_path}")
-        
-        return data
-    except FileNotFoundError:
-        # Try alternate locations if the primary location fails
-        alternate_paths = [
-            "combined_pairs_sampled_for_gpt.json",  # Current directory
-            os.path.join(base_dir, "combined_pairs_sampled_for_gpt.json"),  # Project root
-            os.path.join(base_dir, "learning_app", "data", "combined_pairs_sampled_for_gpt.json"),  # data directory
-        ]
-        
-        for alt_path in alternate_paths:
-            try:
-                with open(alt_path, "r") as f:
-                    data = json.load(f)
-                print(f"✅ Successfully loaded {len(data)} image pairs from alternate path: {alt_path}")
-                random.shuffle(data)
-                return data
-            except FileNotFoundError:
-                continue
-                
-        # If we get here, no file was found - use a sample dataset
-        print("❌ Could not find combined_pairs.json in any expected location")
-        sample_data = [
-            {
-                "text": "Sample image description 1",
-                "image": "https://via.placeholder.com/600x400.png?text=Sample+Image+1",
-                "label": "unknown"
-            },
-            {
-                "text": "Sample image description 2",
-                "image": "https://via.placeholder.com/600x400.png?text=Sample+Image+2", 
-                "label": "unknown"
-            },
-            {
-                "text": "Sample image description 3",
-                "image": "https://via.placeholder.com/600x400.png?text=Sample+Image+3",
-                "label": "unknown"
-            }
-        ]
-        st.warning("⚠️ Using sample data - combined_pairs.json not found")
-        return sample_data
-
-def validate_image_data(data_list):
-    """Clean and validate image data before using it"""
-    # Removed misleading print statement
-    valid_data = []
-    for item in data_list:
-        # Ensure required fields exist
-        if not item.get("image"):
-            # Add a placeholder image URL if missing
-            item["image"] = "https://placehold.co/600x400/gray/white?text=No+Image"
-        
-        # Ensure text/caption exists
-        if not item.get("text") and not item.get("caption"):
-            item["text"] = "No caption available"
-            
-        valid_data.append(item)
-    
-    return valid_data
+    alternate_paths = [
+        "combined_pairs_sampled_for_gpt.json",  # Current directory
+        os.path.join(base_dir, "combined_pairs_sampled_for_gpt.json"),  # Project root
+        os.path.join(base_dir, "learning_app", "data", "combined_pairs_sampled_for_gpt.json"),  # data directory
+    ]
+
+    for path in [file_path] + alternate_paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            # Normalised to the canonical pair schema (id, url, caption, source, flags)
+            # once per source version and cached on disk as an indexed record file;
+            # items are decoded only when the UI asks for them
+            data = open_pairs(path)
+            print(f"✅ Successfully loaded {len(data)} image pairs from {path}")
+            return data
+        except Exception as e:
+            print(f"❌ Could not load image pairs from {path}: {e}")
+
+    # If we get here, no file was found - use a sample dataset
+    print("❌ Could not find combined_pairs.json in any expected location")
+    sample_data = [
+        canonical_pair(
+            f"https://via.placeholder.com/600x400.png?text=Sample+Image+{n}",
+            f"Sample image description {n}",
+            source="sample",
+        )
+        for n in (1, 2, 3)
+    ]
+    st.warning("⚠️ Using sample data - combined_pairs.json not found")
+    return freeze_items(sample_data)
+
+def dataset_image_ids(data):
+    """id of every pair; record files answer from their index without decoding items, once per process"""
+    if isinstance(data, MappedPairs):
+        return data.image_ids()
+    return tuple(item["id"] for item in data)
 
 # Use custom CSS to make the sidebar wider and style the login form
 st.markdown("""
@@ -302,6 +285,7 @@ with st.sidebar:
         st.markdown(f"Logged in as: **{st.session_state.user.get('email', '')}**")
         
         if st.button("Logout", use_container_width=True):
+            flush_tag_writes()
             st.session_state.user = None
             st.session_state.page = "login"
             st.rerun()
@@ -491,6 +475,7 @@ elif st.session_state.page == "tagging":
     
     with col2:
         if st.button("Logout"):
+            flush_tag_writes()
             st.session_state.user = None
             st.session_state.page = "login"
             st.rerun()
@@ -541,39 +526,60 @@ elif st.session_state.page == "tagging":
             🔍 Need help? Refer to the **Quick Reference** in the sidebar for visual examples.
             """)
             
-    # Cache the shuffled data to avoid unnecessary computation
-    def get_shuffled_data(data):
-        random.seed(int(time.time()))
     # Load image data first
-    image_data = validate_image_data(load_image_pairs())
-    
-    # Define the shuffle function
-    @st.cache_data(ttl=3600)
-    def get_shuffled_data(data):
-        import time
-        import random
-        random.seed(int(time.time()))
-        random.shuffle(data)
-        return data
-    
+    image_data = load_image_pairs()
+    if not image_data:
         st.error("❌ No image data available. Please check your dataset or file paths. "
                  "Ensure the file exists at the specified location and is properly formatted. "
                  "Refer to the [documentation](https://example.com/docs) for more details.")
-    image_data = get_shuffled_data(image_data)
-    random.shuffle(image_data)
-    
-    idx = st.session_state.image_index
+
+    # Each user walks the data in their own stable order (no shuffled copy per
+    # session or rerun), resuming from the cursor saved for their uid
+    uid = st.session_state.user.get("uid", "anonymous")
+    image_data = user_order(image_data, uid)
+    if st.session_state.get("queue_cursor_uid") != uid:
+        st.session_state.image_index = get_queue_cursor(uid)
+        st.session_state.queue_cursor_uid = uid
+        st.session_state.saved_queue_cursor = st.session_state.image_index
+        st.session_state.last_image_index = None
+
+    # Shared per process: who tagged what, vote counts and leases
+    assignment = get_assignment_service(
+        dataset_image_ids(image_data.data),
+        vote_source=get_image_tag_counts,
+        user_source=list_user_tagged_image_ids,
+    )
+    blocklist = get_blocklist()
+
+    last_idx = st.session_state.get("last_image_index")
+    if last_idx is None or st.session_state.image_index > last_idx:
+        # Moving forward (or just arrived): the next image this user has not tagged,
+        # images below the target vote count first, not leased to someone else
+        idx = assignment.next_for_user(
+            uid,
+            image_data.permutation,
+            st.session_state.image_index,
+            is_blocked=lambda position: blocklist.is_blocked(image_data.data[position]),
+        )
+    else:
+        # Going back (or staying): show what they asked for, stepping over blocked images
+        step = -1 if st.session_state.image_index < last_idx else 1
+        idx = blocklist.next_allowed(image_data, st.session_state.image_index, step)
+        if idx < len(image_data):
+            assignment.hold(uid, get_image_id(image_data[idx]))
+    st.session_state.image_index = st.session_state.last_image_index = idx
+
+    if idx != st.session_state.saved_queue_cursor:
+        save_queue_cursor(uid, idx)
+        st.session_state.saved_queue_cursor = idx
 
     if 0 <= idx < len(image_data):
         # Pass the ENTIRE image_data list, not just one item
-        render_tagging_ui(image_data, st.session_state.user, idx)
+        render_tagging_ui(image_data, st.session_state.user, idx, assignment=assignment)
     else:
         st.success("🎉 You've tagged all the images!")
     # === Sidebar Info with Art Elements Reference ===
     render_art_elements_sidebar()
     
-    # Also add the download UI to the sidebar
-    from learning_app.utils.ui_components import render_download_ui, render_tagging_ui
-    render_download_ui()
-    # Also add the download UI to the sidebar
+    # Also add the download UI to the sidebar (once per run)
     render_download_ui()
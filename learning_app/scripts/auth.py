@@ -1,11 +1,10 @@
 # 🔐 auth.py
-import firebase_admin
-from firebase_admin import auth, credentials
+from firebase_admin import auth
 import os
 import streamlit as st
 import smtplib
 from email.message import EmailMessage
-from learning_app.utils.config import get_firebase_credentials
+from learning_app.utils.firebase_client import get_firebase_app
 
 # Add the CREDENTIALS dictionary to validate simple logins
 CREDENTIALS = {
@@ -16,27 +15,12 @@ CREDENTIALS = {
     "bmcmanus": "123"  # This was in your example earlier
 }
 
-# Only initialize once
-if not firebase_admin._apps:
-    try:
-        # Get Firebase credentials directly from the config module
-        cred_dict = get_firebase_credentials()
-        
-        if not cred_dict:
-            raise ValueError("Missing Firebase credentials")
-            
-        cred = credentials.Certificate(cred_dict)
-        firebase_admin.initialize_app(cred)
-        print("✅ Firebase Auth initialized")
-    except Exception as e:
-        print(f"⚠️ Firebase admin initialization error: {e}")
-
 def verify_firebase_login(email, password):
     """Verify login credentials with Firebase Auth"""
     try:
         # Since this is server-side, we need to use Firebase Admin SDK
         # First check if the user exists
-        user = auth.get_user_by_email(email)
+        user = auth.get_user_by_email(email, app=get_firebase_app())
         # If user exists but not verified, return None with special code
         if not user.email_verified:
             print(f"⚠️ Email not verified for {email}")
@@ -73,7 +57,7 @@ def login_user(email, password):
     try:
         # First check if user exists in Firebase
         try:
-            user = auth.get_user_by_email(email)
+            user = auth.get_user_by_email(email, app=get_firebase_app())
             uid = user.uid
             display_name = user.display_name or email.split('@')[0]
             
@@ -102,7 +86,8 @@ def create_user(email, password, display_name):
             email=email,
             password=password,
             display_name=display_name,
-            email_verified=False
+            email_verified=False,
+            app=get_firebase_app()
         )
         
         # Send verification email
@@ -128,7 +113,7 @@ def send_verification_email(recipient_email):
 
     # Step 1: Generate Firebase verification link
     try:
-        verify_link = auth.generate_email_verification_link(recipient_email)
+        verify_link = auth.generate_email_verification_link(recipient_email, app=get_firebase_app())
     except Exception as e:
         print(f"❌ Failed to generate verification link: {e}")
         return False
@@ -192,6 +177,9 @@ def login_form():
 def logout_button():
     """Display logout button"""
     if st.button("Logout", key="logout_btn"):
+        # Make sure queued tag writes reach Firebase before the session ends
+        from learning_app.utils.firebase_service import flush_tag_writes
+        flush_tag_writes()
         st.session_state.pop("user", None)
         st.session_state.pop("image_index", None)
         st.rerun()
@@ -1,12 +1,14 @@
 import streamlit as st
 from datetime import datetime
 import os
-import json
 import pandas as pd
 import csv
 import traceback
 import logging
 import sys
+import atexit
+import threading
+from collections.abc import Sequence
 
 # Add the parent directory to path to ensure imports work regardless of how script is run
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -41,172 +43,107 @@ try:
     FIREBASE_AVAILABLE = True
 except ImportError:
     FIREBASE_AVAILABLE = False
-    def save_tag_to_firebase(image_id, data):
+    def save_tag_to_firebase(image_id, data, user=None):
         logging.warning(f"Firebase service not available, data for image {image_id} saved locally only")
         return False
 
+from learning_app.utils.local_tag_store import get_local_tag_store
+from learning_app.utils.failures_view import get_failures_view
+from learning_app.utils.export_cache import get_export_file
+from learning_app.utils.write_buffer import CoalescingWriteBuffer
+from learning_app.utils.file_lock import FileLock
+from learning_app.utils.blocklist import get_blocklist
+from learning_app.utils.autosave import FieldDiffAutosaver
+from learning_app.utils.image_ids import get_image_id
+from learning_app.utils.image_cache import PREFETCH_AHEAD, get_image_cache
+
 # Toggle to show extra dev info or test buttons
 IS_DEV = False
 
 # --- Data management functions ---
 def load_export_data():
-    """Load tagging export data from CSV and JSON files"""
-    export_dir = "learning_app/output/pairs"
-    csv_path = os.path.join(export_dir, "tagged_results_export.csv")
-    json_path = os.path.join(export_dir, "tagged_results_export.json")
-
+    """Paths of the CSV and JSON exports, built from the local tag store only if it changed"""
     try:
-        # Ensure directory exists
-        os.makedirs(export_dir, exist_ok=True)
-        
-        # Handle CSV data
-        if os.path.exists(csv_path):
-            with open(csv_path, "r") as f:
-                csv_data = f.read()
-        else:
-            # Create empty CSV if file doesn't exist
-            csv_data = "image_id,text,rejected,flagged,tagger,tags\n"
-            with open(csv_path, "w") as f:
-                f.write(csv_data)
-        
-        # Handle JSON data
-        if os.path.exists(json_path):
-            with open(json_path, "r") as f:
-                json_data = json.load(f)
-        else:
-            # Create empty JSON if file doesn't exist
-            json_data = []
-            with open(json_path, "w") as f:
-                json.dump(json_data, f)
-        
-        return csv_data, json.dumps(json_data)
-                
+        return get_export_file("csv"), get_export_file("json")
+
     except Exception as e:
         print(f"Error in load_export_data: {str(e)}")
         print("Traceback:")
         traceback.print_exc()
-        return "", "[]"
+        return None, None
 
 def export_failures():
-    """Generate a CSV of failures (rejected or flagged items)"""
-    input_path = "learning_app/output/pairs/tagged_results_export.json"
-    output_path = "learning_app/output/pairs/tagged_results_failures.csv"
-
-    if not os.path.exists(input_path):
-        # Create an empty CSV with headers if input file doesn't exist
-        pd.DataFrame(columns=["image_id", "text", "rejected", "flagged", "tagger", "tags"]).to_csv(output_path, index=False)
-        return
-
+    """Write the failures CSV (rejected or flagged items) if the view changed since the last write"""
     try:
-        with open(input_path, "r") as f:
-            data = json.load(f)
-
-        # Convert data to list if it's not already
-        if not isinstance(data, list):
-            if isinstance(data, dict):
-                # If it's a dictionary, convert its values to a list
-                data = list(data.values())
-            else:
-                # If it's neither a list nor a dict, make an empty list
-                data = []
-        
-        # Initialize failure_rows list
-        failure_rows = []
-        
-        # Loop through all items in the data
-        for item in data:
-            # Skip items that aren't dictionaries (like simple strings)
-            if not isinstance(item, dict):
-                logging.warning(f"Skipping non-dictionary item: {item}")
-                continue
-                
-            # Now safely access dictionary attributes
-            if item.get("rejected") or item.get("flagged"):
-                failure_rows.append({
-                    "image_id": item.get("image_id", "unknown"),
-                    "text": item.get("text", ""),
-                    "rejected": item.get("rejected", False),
-                    "flagged": item.get("flagged", False),
-                    "tagger": item.get("tagger", ""),
-                    "tags": json.dumps(item.get("tags", {}))
-                })
-
-        if failure_rows:
-            df = pd.DataFrame(failure_rows)
-            df.to_csv(output_path, index=False)
-        else:
-            # Create an empty CSV with headers if no failures
-            pd.DataFrame(columns=["image_id", "text", "rejected", "flagged", "tagger", "tags"]).to_csv(output_path, index=False)
-            
+        get_failures_view().flush()
     except Exception as e:
         logging.error(f"Error exporting failures: {str(e)}")
-        # Create an empty CSV with headers if there's an error
-        pd.DataFrame(columns=["image_id", "text", "rejected", "flagged", "tagger", "tags"]).to_csv(output_path, index=False)
 
 def init_exports():
-    """Initialize exports at startup"""
+    """Initialize exports at startup (a no-op once the failures CSV is up to date)"""
     export_failures()
 
 # --- Tag caching system ---
-tag_cache = []
+# One buffer per server process, shared by every session thread. Saves are
+# coalesced per image_id and written by a single flusher thread; the file lock
+# keeps writes from several server processes from interleaving.
+TAG_FLUSH_INTERVAL_MS = 2000
+TAG_FLUSH_BATCH_SIZE = 10
+TAG_MAX_PENDING = 1000
+LOCAL_WRITE_LOCK_PATH = "learning_app/output/pairs/local_tags.lock"
+
+_tag_buffer = None
+_tag_buffer_lock = threading.Lock()
+_local_write_lock = FileLock(LOCAL_WRITE_LOCK_PATH)
+
+def write_local_tags(batch):
+    """Flush function for the tag buffer: {image_id: tag_data} → local store + failures view"""
+    store = get_local_tag_store()
+    failures = get_failures_view()
+    with _local_write_lock:
+        since_version = store.version
+        store.put_many(list(batch.values()))
+        failures.record(batch.values(), since_version)
+        failures.flush()
+
+def get_tag_buffer():
+    """The process-wide local tag write buffer, created on first use"""
+    global _tag_buffer
+    if _tag_buffer is None:
+        with _tag_buffer_lock:
+            if _tag_buffer is None:
+                _tag_buffer = CoalescingWriteBuffer(
+                    write_local_tags,
+                    flush_interval_ms=TAG_FLUSH_INTERVAL_MS,
+                    max_batch=TAG_FLUSH_BATCH_SIZE,
+                    max_pending=TAG_MAX_PENDING,
+                    name="local-tag-writer",
+                )
+                atexit.register(_tag_buffer.close)
+    return _tag_buffer
 
 def flush_tag_cache():
-    """Flush the in-memory tag cache to the files."""
-    global tag_cache
-    if not tag_cache:
-        return
-
+    """Flush the buffered tags to the local tag store."""
     try:
-        export_dir = "learning_app/output/pairs"
-        os.makedirs(export_dir, exist_ok=True)
-
-        # Update JSON file
-        json_path = os.path.join(export_dir, "tagged_results_export.json")
-        try:
-            with open(json_path, "r") as f:
-                existing_data = json.load(f)
-                if not isinstance(existing_data, list):
-                    existing_data = []
-        except (FileNotFoundError, json.JSONDecodeError):
-            existing_data = []
-
-        # Merge cache into existing data
-        for tag_data in tag_cache:
-            updated = False
-            for i, item in enumerate(existing_data):
-                if item.get("image_id") == tag_data["image_id"]:
-                    existing_data[i] = tag_data
-                    updated = True
-                    break
-            if not updated:
-                existing_data.append(tag_data)
-
-        # Save updated data
-        with open(json_path, "w") as f:
-            json.dump(existing_data, f, indent=2)
-
-        # Update CSV file
-        csv_path = os.path.join(export_dir, "tagged_results_export.csv")
-        df = pd.DataFrame(existing_data)
-        df.to_csv(csv_path, index=False)
-
-        # Clear the cache
-        tag_cache = []
+        get_tag_buffer().flush()
     except Exception as e:
         print(f"Error flushing tag cache: {str(e)}")
 
+def get_tag_buffer_stats():
+    """Queue depth and flush latency of the local tag buffer"""
+    return {**get_tag_buffer().stats(), "lock_wait_seconds": round(_local_write_lock.wait_seconds, 3)}
+
 def save_current_tags(image_item, tags, user_email, user_info=None):
-    """Save the current image tags to the in-memory cache."""
-    global tag_cache
+    """Queue the current image tags for the local tag store."""
     try:
-        image_id = image_item.get("id", image_item.get("image_id", str(hash(image_item.get("image", "")))))
+        image_id = get_image_id(image_item)
         uid = user_info.get("uid", f"email-{hash(user_email)}") if user_info else f"email-{hash(user_email)}"
         display_name = user_info.get("display_name", user_email.split('@')[0]) if user_info else user_email.split('@')[0]
 
         tag_data = {
             "image_id": image_id,
-            "text": image_item.get("text", ""),
-            "image_url": image_item.get("image", ""),
+            "text": image_item["caption"],
+            "image_url": image_item["url"],
             "tags": tags,
             "tagger": user_email,
             "uid": uid,
@@ -214,13 +151,8 @@ def save_current_tags(image_item, tags, user_email, user_info=None):
             "timestamp": pd.Timestamp.now().isoformat()
         }
 
-        # Add to cache
-        tag_cache.append(tag_data)
-
-        # Optionally flush cache if it exceeds a certain size
-        if len(tag_cache) >= 10:  # Adjust the batch size as needed
-            flush_tag_cache()
-        return True
+        # Replaces any save for this image that is still waiting to be written
+        return get_tag_buffer().put(image_id, tag_data, timeout=5)
     except Exception as e:
         print(f"Error saving tags: {str(e)}")
         return False
@@ -249,12 +181,12 @@ def mark_as_offensive(item, user_email):
         
         # Prepare data
         timestamp = datetime.now().isoformat()
-        image_id = item.get("id", item.get("image_id", str(hash(item.get("image", "")))))
+        image_id = get_image_id(item)
         item_data = {
             "timestamp": timestamp,
             "image_id": image_id,
-            "image_url": item.get("image", ""),
-            "text": item.get("text", ""),
+            "image_url": item["url"],
+            "text": item["caption"],
             "flagged_by": user_email
         }
         
@@ -266,17 +198,8 @@ def mark_as_offensive(item, user_email):
                 writer.writeheader()  # Write header only if file doesn't exist
             writer.writerow(item_data)
         
-        # Also save to a JSON file for backup
-        json_path = os.path.join(output_dir, "offensive_images.json")
-        try:
-            with open(json_path, "r") as f:
-                data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            data = []
-        data.append(item_data)
-        
-        with open(json_path, "w") as f:
-            json.dump(data, f, indent=2)
+        # Append to the blocklist log so no session is served this image again
+        get_blocklist().add(item_data)
             
         # Update the image item with offensive flag in firebase if available
         item_with_flag = {**item, "offensive": True}
@@ -297,12 +220,12 @@ def flag_image(image_item, user_email, flag_type="flagged"):
     """Flag or reject an image"""
     try:
         # Prepare data for saving
-        image_id = image_item.get("id", image_item.get("image_id", str(hash(image_item.get("image", "")))))
+        image_id = get_image_id(image_item)
         
         tag_data = {
             "image_id": image_id,
-            "text": image_item.get("text", ""),
-            "image_url": image_item.get("image", ""),
+            "text": image_item["caption"],
+            "image_url": image_item["url"],
             "tags": {},
             "tagger": user_email,
             "timestamp": pd.Timestamp.now().isoformat(),
@@ -310,77 +233,103 @@ def flag_image(image_item, user_email, flag_type="flagged"):
             "rejected": flag_type == "rejected"
         }
         
-        # Define the export directory and json path
-        export_dir = "learning_app/output/pairs"
-        json_path = os.path.join(export_dir, "tagged_results_export.json")
-        
-        # Load existing data
-        try:
-            with open(json_path, "r") as f:
-                existing_data = json.load(f)
-                # Ensure the data is a list
-                if not isinstance(existing_data, list):
-                    existing_data = []
-        except (FileNotFoundError, json.JSONDecodeError):
-            existing_data = []
-        
-        # Check if this image already exists in the data
-        updated = False
-        for i, item in enumerate(existing_data):
-            if isinstance(item, dict) and item.get("image_id") == image_id:
-                existing_data[i] = tag_data
-                updated = True
-                break
-                
-        if not updated:
-            existing_data.append(tag_data)
-            
-        # Save updated data
-        with open(json_path, "w") as f:
-            json.dump(existing_data, f, indent=2)
-            
-        # Update failures export
-        export_failures()
+        # Any buffered save for this image goes first so the flag is the newest record
+        flush_tag_cache()
+        with _local_write_lock:
+            store = get_local_tag_store()
+            since_version = store.version
+            store.put(tag_data)
+
+            # Appends one line to the failures CSV (or marks it for a rebuild)
+            get_failures_view().record([tag_data], since_version)
+            export_failures()
         
         return True
     except Exception as e:
         print(f"Error flagging image: {str(e)}")
         return False
 
+# --- Autosave ---
+AUTOSAVE_DEBOUNCE_SECONDS = 2.0
+
+def send_autosave(image_id, record, changed, context):
+    """Autosave send function; runs on the autosave timer thread, so no Streamlit calls"""
+    current_item, user_info, assignment = context
+    # Local first: it is cheap and survives a Firebase outage. The local store
+    # keeps one whole record per image, so it gets the full record.
+    save_current_tags(current_item, record["tags"], record["tagger"], user_info)
+    if FIREBASE_AVAILABLE:
+        # Only the changed fields go to Firebase; the replay applies them to the stored tag
+        if not save_tag_to_firebase(image_id, changed, user=user_info):
+            raise RuntimeError(f"Firebase save of {image_id} failed")
+    else:
+        logging.warning("Firebase not available for saving - using local storage only")
+    if assignment is not None:
+        assignment.mark_tagged(user_info.get("uid"), image_id)
+
+def get_autosaver():
+    """This session's autosaver"""
+    if "autosaver" not in st.session_state:
+        st.session_state.autosaver = FieldDiffAutosaver(
+            send_autosave,
+            debounce_seconds=AUTOSAVE_DEBOUNCE_SECONDS,
+            name=f"autosave-{st.session_state.get('user', {}).get('uid', 'anonymous')}",
+        )
+    return st.session_state.autosaver
+
 # --- UI component rendering ---
 def render_download_ui(session_id=None):
     """Render download buttons with unique keys based on session_id"""
     st.sidebar.markdown("## 📥 Download Your Exports")
     
-    # Generate a unique suffix for keys
-    key_suffix = f"_{session_id}" if session_id else f"_{int(datetime.now().timestamp())}"
+    # Keys must stay the same across reruns or button clicks get lost
+    key_suffix = f"_{session_id}" if session_id else ""
+
+    # Exports are only built on a click; later reruns keep offering the files
+    # built then instead of rebuilding them after every save
+    prepared_key = f"prepared_exports{key_suffix}"
+    label = "🔄 Refresh downloads" if st.session_state.get(prepared_key) else "📦 Prepare downloads"
+    if st.sidebar.button(label, key=f"prepare_exports_button{key_suffix}"):
+        st.session_state[prepared_key] = load_export_data()
+    if not st.session_state.get(prepared_key):
+        return
     
     # Get timestamp for filenames
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    csv_data, json_data = load_export_data()
+    # A newer build (from any session) replaces older export files
+    csv_path, json_path = [
+        path if path and os.path.exists(path) else None
+        for path in st.session_state[prepared_key]
+    ]
+    if not (csv_path or json_path):
+        st.sidebar.caption("Exports changed since they were prepared; refresh to rebuild them.")
     
-    st.sidebar.download_button(
-        label="⬇️ Download CSV Export",
-        data=csv_data,
-        file_name=f"tagged_results_export_{timestamp}.csv",
-        mime="text/csv",
-        key=f"download_csv_button{key_suffix}"
-    )
+    if csv_path:
+        with open(csv_path, "rb") as f:
+            st.sidebar.download_button(
+                label="⬇️ Download CSV Export",
+                data=f,
+                file_name=f"tagged_results_export_{timestamp}.csv",
+                mime="text/csv",
+                key=f"download_csv_button{key_suffix}"
+            )
     
-    st.sidebar.download_button(
-        label="⬇️ Download JSON Export",
-        data=json_data,
-        file_name=f"tagged_results_export_{timestamp}.json",
-        mime="application/json",
-        key=f"download_json_button{key_suffix}"
-    )
+    if json_path:
+        with open(json_path, "rb") as f:
+            st.sidebar.download_button(
+                label="⬇️ Download JSON Export",
+                data=f,
+                file_name=f"tagged_results_export_{timestamp}.json",
+                mime="application/json",
+                key=f"download_json_button{key_suffix}"
+            )
     
-    failures_path = "learning_app/output/pairs/tagged_results_failures.csv"
-    if os.path.exists(failures_path):
-        with open(failures_path, "r") as f:
-            failure_csv = f.read()
-        
+    failures = get_failures_view()
+    if len(failures):
+        # Cached inside the view until its version changes
+        failure_csv = failures.csv_text()
+
         st.sidebar.download_button(
             label="⚠️ Download Failures Only (CSV)",
             data=failure_csv,
@@ -389,8 +338,31 @@ def render_download_ui(session_id=None):
             key=f"download_failures_button{key_suffix}"
         )
 
-def render_tagging_ui(image_data, user_info, current_index=0):
-    """Render the main image tagging interface"""
+def upcoming_items(image_data, user_info, current_index, assignment=None):
+    """The next PREFETCH_AHEAD items this user will be shown, as the assignment service would pick them"""
+    permutation = getattr(image_data, "permutation", None)
+    if assignment is None or permutation is None:
+        return image_data[current_index + 1:current_index + 1 + PREFETCH_AHEAD]
+    blocklist = get_blocklist()
+    indexes = assignment.upcoming(
+        user_info.get("uid", "anonymous"),
+        permutation,
+        current_index + 1,
+        PREFETCH_AHEAD,
+        is_blocked=lambda position: blocklist.is_blocked(image_data.data[position]),
+    )
+    return [image_data[index] for index in indexes]
+
+def render_tagging_ui(image_data, user_info, current_index=0, assignment=None):
+    """
+    Render the main image tagging interface
+
+    Parameters:
+    - image_data: sequence of canonical pairs (see utils/pair_schema.py) in the user's queue order
+    - user_info: the logged-in user
+    - current_index: queue position to show
+    - assignment: optional AssignmentService told about every saved tag
+    """
     # Run initialization tasks
     init_exports()
     
@@ -446,7 +418,7 @@ def render_tagging_ui(image_data, user_info, current_index=0):
     """, unsafe_allow_html=True)
     
     # Basic validation
-    if not isinstance(image_data, list):
+    if not isinstance(image_data, Sequence) or isinstance(image_data, (str, dict)):
         st.error("Expected a list of images but received a single item or wrong type")
         return
         
@@ -468,82 +440,67 @@ def render_tagging_ui(image_data, user_info, current_index=0):
     # Create columns for layout
     col1, col2 = st.columns([0.6, 0.4])
 
-    # Initialize form variables
-    primary_element = ELEMENT_OPTIONS[0]
-    secondary_element = "None"
-    primary_principle = PRINCIPLE_OPTIONS[0]
-    secondary_principle = "None"
-    quality = "Medium"
-    issues = []
-    irrelevant = False
-    notes = ""
-    
-    # Define save_state function
-    def save_state():
-        # Collect tag data
-        save_tags = {
-            "primary_element": primary_element,
-            "secondary_element": secondary_element,
-            "primary_principle": primary_principle,
-            "secondary_principle": secondary_principle,
-            "quality": quality,
+    # Content-addressed ID assigned when the pairs were normalised; every writer uses it
+    image_id = get_image_id(current_item)
+
+    def current_tags():
+        # Read the widgets from session state: callbacks run before the script
+        # body, so local variables would still hold the previous run's values
+        state = st.session_state
+        issues = [
+            issue for issue, key in (
+                ("blurry", "issue_blurry"),
+                ("watermark", "issue_watermark"),
+                ("text_overlay", "issue_text"),
+                ("irrelevant", "irrelevant"),
+            )
+            if state.get(f"{key}_{current_index}", False)
+        ]
+        return {
+            "primary_element": state.get(f"primary_element_{current_index}", ELEMENT_OPTIONS[0]),
+            "secondary_element": state.get(f"secondary_element_{current_index}", "None"),
+            "primary_principle": state.get(f"primary_principle_{current_index}", PRINCIPLE_OPTIONS[0]),
+            "secondary_principle": state.get(f"secondary_principle_{current_index}", "None"),
+            "quality": state.get(f"quality_{current_index}", "High"),
             "issues": issues,
-            "irrelevant": irrelevant,
-            "notes": notes
+            "irrelevant": state.get(f"irrelevant_{current_index}", False),
+            "notes": state.get(f"notes_{current_index}", ""),
         }
-        
-        # Save to Firebase
+
+    # Define save_state function
+    def save_state(force=False):
+        """Hand the form to the autosaver; it only saves fields that changed, debounced unless forced"""
         try:
-            if FIREBASE_AVAILABLE:
-                # Generate image ID
-                if "image_filename" in current_item:
-                    image_id = current_item["image_filename"]
-                elif "image" in current_item and current_item["image"]:
-                    url_parts = current_item["image"].split("/")
-                    image_id = url_parts[-1].replace(".", "_")
-                else:
-                    image_id = str(hash(current_item.get("text", "") + str(current_index)))
-                
-                # Ensure user_info contains an email key
-                user_email = user_info.get("email", "unknown_user@example.com")
-                
-                # Prepare data for Firebase
-                firebase_data = {
-                    "text": current_item.get("text", ""),
-                    "image_url": current_item.get("image", ""),
-                    "tags": save_tags,
-                    "tagger": user_email,
-                    "timestamp": pd.Timestamp.now().isoformat()
-                }
-                
-                # Save to Firebase
-                save_tag_to_firebase(image_id, firebase_data)
-                st.toast("Tags saved", icon="✅")
-            else:
-                logging.warning("Firebase not available for saving - using local storage only")
+            record = {
+                "text": current_item["caption"],
+                "image_url": current_item["url"],
+                "tags": current_tags(),
+                "tagger": user_info.get("email", "unknown_user@example.com"),
+            }
+            get_autosaver().update(image_id, record, context=(current_item, user_info, assignment), force=force)
+            return True
         except Exception as e:
-            logging.error(f"Firebase save failed: {e}")
-            st.error("Failed to save tags to Firebase. Please try again later or contact support.")
-            import traceback
-            error_message = f"Firebase save failed: {e}"
-            print(error_message)
+            logging.error(f"Save failed: {e}")
             traceback.print_exc()
-            st.error(f"An error occurred while saving to Firebase: {error_message}")
-        
-        # Save to local storage
-        return save_current_tags(current_item, save_tags, user_info["email"], user_info)
+            st.error(f"An error occurred while saving your tags: {e}")
+            return False
     
     # Render UI components
     with col1:
         # Display the image
-        image_url = current_item.get("image", current_item.get("image_url", ""))
+        image_url = current_item["url"]
         if image_url:
-            st.image(image_url, use_container_width=True)
+            # Local, display-sized bytes when cached; otherwise the URL while the prefetch pool fetches it
+            image_cache = get_image_cache()
+            st.image(image_cache.get(image_url) or image_url, use_container_width=True)
+
+            # Warm the cache for the images the assignment will hand out next
+            image_cache.prefetch(item["url"] for item in upcoming_items(image_data, user_info, current_index, assignment))
         else:
             st.warning("No image available")
             
         # Display the text
-        text = current_item.get("text", current_item.get("caption", "No caption available"))
+        text = current_item["caption"] or "No caption available"
         st.markdown(f"**Caption:** {text}")
         
         # Add Next/Previous buttons under the image
@@ -551,14 +508,14 @@ def render_tagging_ui(image_data, user_info, current_index=0):
         with prev_col:
             prev_disabled = current_index <= 0
             if st.button("⬅️ Previous", use_container_width=True, disabled=prev_disabled):
-                save_state()
+                save_state(force=True)
                 st.session_state.image_index = current_index - 1
                 st.rerun()
                 
         with next_col:
             next_disabled = current_index >= len(image_data) - 1
             if st.button("➡️ Next", use_container_width=True, disabled=next_disabled):
-                save_state()
+                save_state(force=True)
                 st.session_state.image_index = current_index + 1
                 st.rerun()
     
@@ -569,14 +526,14 @@ def render_tagging_ui(image_data, user_info, current_index=0):
         # Right column - Art Elements and Principles
         with right_col:
             st.markdown("### Elements of Art & Design")
-            primary_element = st.selectbox(
+            st.selectbox(
                 "Primary Element", 
                 options=ELEMENT_OPTIONS,
                 key=f"primary_element_{current_index}",
                 on_change=save_state
             )
             
-            secondary_element = st.selectbox(
+            st.selectbox(
                 "Secondary Element", 
                 options=["None"] + ELEMENT_OPTIONS,
                 key=f"secondary_element_{current_index}",
@@ -584,14 +541,14 @@ def render_tagging_ui(image_data, user_info, current_index=0):
             )
         
             st.markdown("### Principles of Art & Design")
-            primary_principle = st.selectbox(
+            st.selectbox(
                 "Primary Principle", 
                 options=PRINCIPLE_OPTIONS,
                 key=f"primary_principle_{current_index}",
                 on_change=save_state
             )
             
-            secondary_principle = st.selectbox(
+            st.selectbox(
                 "Secondary Principle", 
                 options=["None"] + PRINCIPLE_OPTIONS,
                 key=f"secondary_principle_{current_index}",
@@ -601,7 +558,7 @@ def render_tagging_ui(image_data, user_info, current_index=0):
         # Left column - Quality and Issues
         with left_col:
             st.markdown("### Image Quality")
-            quality = st.radio(
+            st.radio(
                 "Quality Rating", 
                 ["High", "Medium", "Low"], 
                 key=f"quality_{current_index}",
@@ -609,32 +566,20 @@ def render_tagging_ui(image_data, user_info, current_index=0):
             )
             
             st.markdown("### Issues")
-            issues = []
-            
             # Issue checkboxes
-            blurry = st.checkbox("Blurry", key=f"issue_blurry_{current_index}", on_change=save_state)
-            if blurry:
-                issues.append("blurry")
-                
-            watermark = st.checkbox("Watermark", key=f"issue_watermark_{current_index}", on_change=save_state)
-            if watermark:
-                issues.append("watermark")
-                
-            text_overlay = st.checkbox("Text Overlay", key=f"issue_text_{current_index}", on_change=save_state)
-            if text_overlay:
-                issues.append("text_overlay")
-                
+            st.checkbox("Blurry", key=f"issue_blurry_{current_index}", on_change=save_state)
+            st.checkbox("Watermark", key=f"issue_watermark_{current_index}", on_change=save_state)
+            st.checkbox("Text Overlay", key=f"issue_text_{current_index}", on_change=save_state)
+
             # Irrelevant image checkbox
             st.markdown("")
-            irrelevant = st.checkbox(
+            st.checkbox(
                 "🚫 Image Irrelevant/Missing", 
                 key=f"irrelevant_{current_index}", 
                 help="Check if the image is missing or not relevant to the caption",
                 on_change=save_state
             )
-            if irrelevant:
-                issues.append("irrelevant")
-                
+
             # Offensive content button
             st.markdown("")
             if st.button(
@@ -650,42 +595,17 @@ def render_tagging_ui(image_data, user_info, current_index=0):
         
         # Notes section
         st.markdown("### Notes")
-        notes = st.text_area("Additional Notes", key=f"notes_{current_index}", height=100, on_change=save_state)
+        st.text_area("Additional Notes", key=f"notes_{current_index}", height=100, on_change=save_state)
         
         # Action buttons for saving
         st.markdown("---")
         if st.button("💾 Save Tags", use_container_width=True):
-            save_state()
+            save_state(force=True)
             st.success("Tags saved successfully!")
 
-    # Set up autosave functionality
-    if "last_autosave_index" not in st.session_state or "last_autosave_time" not in st.session_state:
-        st.session_state.last_autosave_index = current_index
-        st.session_state.last_autosave_time = datetime.now()
-        st.session_state.last_autosave_hash = None
-
-    # Prepare current state for comparison
-    current_state = {
-        "primary_element": primary_element,
-        "secondary_element": secondary_element,
-        "primary_principle": primary_principle,
-        "secondary_principle": secondary_principle,
-        "quality": quality,
-        "issues": issues,
-        "irrelevant": irrelevant,
-        "notes": notes,
-    }
-    current_state_hash = hash(json.dumps(current_state, sort_keys=True))
-
-    if "last_autosave_hash" not in st.session_state:
-        st.session_state.last_autosave_hash = current_state_hash
-
-    # Autosave if changes detected and more than 30 seconds passed
-    if (
-        (datetime.now() - st.session_state.last_autosave_time).seconds > 30
-        and current_state_hash != st.session_state.last_autosave_hash
-    ):
-        save_state()
-        st.session_state.last_autosave_time = datetime.now()
-        st.session_state.last_autosave_hash = current_state_hash
-        st.toast("Changes autosaved", icon="✅")
\ No newline at end of file
+    if IS_DEV:
+        st.sidebar.json(get_autosaver().stats())
+        st.sidebar.json(get_image_cache().stats())
+        if assignment is not None:
+            st.sidebar.json(assignment.stats())
+        st.sidebar.json(get_tag_buffer_stats())
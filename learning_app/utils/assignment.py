@@ -0,0 +1,274 @@
+"""
+Assignment of images to taggers.
+
+One AssignmentService per process and dataset keeps, for every dataset
+position:
+
+- a global vote count (array('I')), seeded from /stats/images and refreshed
+  every VOTE_REFRESH_SECONDS, bumped locally as soon as anyone here tags;
+- for each user, a bitset (one bit per position) of what they have tagged,
+  seeded once from a shallow read of /user_tags/{uid} plus their tags still
+  waiting in the outbox;
+- short leases, so concurrent taggers are not handed the same image.
+
+next_for_user() walks the user's own queue order (utils/permutation.py) from
+their cursor, wrapping round to the start, and returns the first image they
+have not tagged, preferring images still below TARGET_VOTES; only when none
+are left does it fall back to any image they have not tagged. upcoming()
+peeks at the images it would offer next, for prefetching. Positions that can
+never become available again for a user (tagged by them, already at the
+target, blocked) are recorded in a per-user "next candidate" forest with path
+compression, so each one is stepped over once: picking the next item is O(1)
+amortised, however large the dataset.
+"""
+import threading
+import time
+from array import array
+
+TARGET_VOTES = 3
+LEASE_SECONDS = 120
+VOTE_REFRESH_SECONDS = 300
+
+
+class AssignmentService:
+    def __init__(self, image_ids, vote_source=None, user_source=None,
+                 target_votes=TARGET_VOTES, lease_seconds=LEASE_SECONDS,
+                 vote_refresh_seconds=VOTE_REFRESH_SECONDS):
+        """
+        Parameters:
+        - image_ids: image_id of every dataset position, in dataset order
+        - vote_source: () → {image_id: number of taggers}, e.g. firebase_service.get_image_tag_counts
+        - user_source: (uid) → image_ids the user has tagged, e.g. firebase_service.list_user_tagged_image_ids
+        - target_votes: votes an image needs before it stops being prioritised
+        - lease_seconds: how long a handed-out image is reserved for its user
+        """
+        self.size = len(image_ids)
+        self.vote_source = vote_source
+        self.user_source = user_source
+        self.target_votes = target_votes
+        self.lease_seconds = lease_seconds
+        self.vote_refresh_seconds = vote_refresh_seconds
+
+        self._positions = {image_id: position for position, image_id in enumerate(image_ids)}
+        self._image_ids = list(image_ids)
+        self._votes = array("I", bytes(4 * self.size))
+        self._votes_loaded_at = None
+        self._tagged = {}     # uid → bytearray bitset over positions
+        self._skip = {}       # (uid, priority pass) → {queue index: later queue index to try}
+        self._leases = {}     # position → (uid, expires_at)
+        self._user_lease = {} # uid → position
+        self._lock = threading.RLock()
+        self._stats = {"assignments": 0, "scanned": 0, "lease_conflicts": 0, "exhausted": 0}
+
+    # --- state loading ---
+    def _load(self, uid, now):
+        """
+        Fetch what the caller is about to need (stale vote counts, uid's tags)
+        without holding _lock, then swap it in under the lock, so one slow
+        read never stalls every other session's Next/Prev.
+        """
+        with self._lock:
+            refresh_votes = self.vote_source is not None and (
+                self._votes_loaded_at is None or now - self._votes_loaded_at >= self.vote_refresh_seconds
+            )
+            if refresh_votes:
+                # Claimed now, so concurrent callers don't start the same read
+                self._votes_loaded_at = now
+            load_user = uid is not None and uid not in self._tagged
+
+        counts = None
+        if refresh_votes:
+            try:
+                counts = self.vote_source() or {}
+            except Exception as e:
+                print(f"⚠️ Could not load vote counts: {e}")
+        tagged_ids = []
+        if load_user and self.user_source is not None:
+            try:
+                tagged_ids = self.user_source(uid) or []
+            except Exception as e:
+                print(f"⚠️ Could not load tags of {uid}: {e}")
+
+        with self._lock:
+            for image_id, count in (counts or {}).items():
+                position = self._positions.get(image_id)
+                # Counts only grow; never lower what this process has already seen
+                if position is not None and isinstance(count, int) and count > self._votes[position]:
+                    self._votes[position] = count
+            if load_user and uid not in self._tagged:
+                bits = self._tagged[uid] = bytearray((self.size + 7) // 8)
+                for image_id in tagged_ids:
+                    position = self._positions.get(image_id)
+                    if position is not None:
+                        bits[position >> 3] |= 1 << (position & 7)
+
+    def _bits(self, uid):
+        """uid's bitset (caller holds the lock; _load has normally filled it already)"""
+        bits = self._tagged.get(uid)
+        if bits is None:
+            bits = self._tagged[uid] = bytearray((self.size + 7) // 8)
+        return bits
+
+    # --- updates ---
+    def has_tagged(self, uid, image_id):
+        position = self._positions.get(image_id)
+        if position is None:
+            return False
+        self._load(uid, time.monotonic())
+        with self._lock:
+            return bool(self._bits(uid)[position >> 3] & (1 << (position & 7)))
+
+    def mark_tagged(self, uid, image_id):
+        """Record a saved tag: sets the user's bit, counts the vote and ends the lease"""
+        position = self._positions.get(image_id)
+        if position is None:
+            return
+        self._load(uid, time.monotonic())
+        with self._lock:
+            bits = self._bits(uid)
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                self._votes[position] += 1
+            if self._leases.get(position, (None,))[0] == uid:
+                del self._leases[position]
+
+    def hold(self, uid, image_id):
+        """Take or renew the lease on the image the user is looking at"""
+        position = self._positions.get(image_id)
+        if position is not None:
+            with self._lock:
+                self._lease(uid, position, time.monotonic())
+
+    def _lease(self, uid, position, now):
+        previous = self._user_lease.get(uid)
+        if previous is not None and previous != position and self._leases.get(previous, (None,))[0] == uid:
+            del self._leases[previous]
+        self._leases[position] = (uid, now + self.lease_seconds)
+        self._user_lease[uid] = position
+
+    # --- selection ---
+    @staticmethod
+    def _find(skip, index):
+        """First queue index at or after index not known to be permanently unavailable"""
+        root = index
+        while root in skip:
+            root = skip[root]
+        # Path compression
+        while index in skip and skip[index] != root:
+            skip[index], index = root, skip[index]
+        return root
+
+    def _candidates(self, uid, order, start, is_blocked, now, stats):
+        """
+        Queue indexes uid may be handed, best first (caller holds the lock).
+
+        Each pass walks from start to the end of the queue, then wraps round
+        to the images before start, so nothing the user skipped past is lost.
+        """
+        bits = self._bits(uid)
+        start = min(max(start, 0), self.size)
+        for prioritised in (True, False):
+            skip = self._skip.setdefault((uid, prioritised), {})
+            for begin, end in ((start, self.size), (0, start)):
+                index = self._find(skip, begin)
+                while index < end:
+                    stats["scanned"] += 1
+                    position = order[index]
+                    done = (
+                        bits[position >> 3] & (1 << (position & 7))
+                        or (prioritised and self._votes[position] >= self.target_votes)
+                        or (is_blocked is not None and is_blocked(position))
+                    )
+                    if done:
+                        # Never available to this user again in this pass: step over it for good
+                        skip[index] = index + 1
+                        index = self._find(skip, index + 1)
+                        continue
+
+                    holder, expires_at = self._leases.get(position, (uid, 0))
+                    if holder != uid and expires_at > now:
+                        stats["lease_conflicts"] += 1
+                        index = self._find(skip, index + 1)
+                        continue
+
+                    yield index
+                    index = self._find(skip, index + 1)
+
+    def next_for_user(self, uid, order, start=0, is_blocked=None):
+        """
+        Queue index of the next image to show uid, searching from start.
+
+        Parameters:
+        - order: the user's queue order, queue index → dataset position (FeistelPermutation)
+        - start: queue index to start from (the user's cursor); images before
+          it are only offered once nothing after it is left
+        - is_blocked: optional (position) → bool for images removed from circulation
+
+        Returns:
+        - A queue index, leased to uid; len(order) when there is nothing left
+        """
+        now = time.monotonic()
+        self._load(uid, now)
+        with self._lock:
+            for index in self._candidates(uid, order, start, is_blocked, now, self._stats):
+                self._lease(uid, order[index], now)
+                self._stats["assignments"] += 1
+                return index
+            self._stats["exhausted"] += 1
+            return self.size
+
+    def upcoming(self, uid, order, start, count, is_blocked=None):
+        """
+        The next count queue indexes next_for_user() would offer uid from start,
+        in that order, without leasing them (e.g. to prefetch their images).
+        The image uid currently holds is left out: it is already on screen.
+        """
+        now = time.monotonic()
+        self._load(uid, now)
+        with self._lock:
+            held = self._user_lease.get(uid)
+            indexes = []
+            peek_stats = {"scanned": 0, "lease_conflicts": 0}
+            for index in self._candidates(uid, order, start, is_blocked, now, peek_stats):
+                if order[index] != held and index not in indexes:
+                    indexes.append(index)
+                    if len(indexes) == count:
+                        break
+            return indexes
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                **self._stats,
+                "images": self.size,
+                "users": len(self._tagged),
+                "active_leases": sum(1 for _, expires_at in self._leases.values() if expires_at > now),
+                "below_target": sum(1 for votes in self._votes if votes < self.target_votes),
+            }
+
+
+_services = {}
+_services_lock = threading.Lock()
+_last_ids = (None, None)  # (image_ids object, its service): skips re-hashing the same ids every rerun
+
+
+def get_assignment_service(image_ids, **kwargs):
+    """The process-wide service for this dataset (rebuilt only if the image ids change)"""
+    global _last_ids
+    ids, service = _last_ids
+    if ids is image_ids:
+        return service
+    key = hash(tuple(image_ids))
+    service = _services.get(key)
+    if service is None:
+        with _services_lock:
+            service = _services.get(key)
+            if service is None:
+                _services.clear()
+                service = _services[key] = AssignmentService(image_ids, **kwargs)
+    if isinstance(image_ids, tuple):
+        # Only an immutable ids object can be trusted not to change behind the cache
+        _last_ids = (image_ids, service)
+    return service
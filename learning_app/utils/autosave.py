@@ -0,0 +1,199 @@
+"""
+Debounced, field-level autosave for the tagging form.
+
+One FieldDiffAutosaver lives in each Streamlit session. Every widget change
+hands it the whole form state for the current image; it compares that with
+the last state it persisted for the image and:
+
+- drops the change if nothing differs (toggling a box back and forth, reruns);
+- otherwise keeps it pending and starts a debounce timer, so a burst of
+  changes within debounce_seconds becomes one save;
+- on save, passes only the changed fields (diff_fields) to send_fn.
+
+Navigation and the explicit Save button call update(..., force=True) to save
+right away. A save that fails stays pending and the timer is re-armed with
+exponential backoff, so it is retried even if the user stops editing. The
+timer runs send_fn on its own thread, so send_fn must not touch Streamlit
+APIs.
+
+apply_fields() and merge_fields() let the receiving side treat those
+{path: value} diffs as patches: apply one to a stored record, or fold a newer
+patch into one still waiting to be sent.
+"""
+import threading
+
+
+def diff_fields(old, new, prefix="", max_depth=2):
+    """
+    {path: value} for every field of new that differs from old.
+
+    Nested dicts are compared field by field down to max_depth levels; removed
+    fields map to None (which deletes them in an RTDB update).
+    """
+    old = old or {}
+    changed = {}
+    for key in set(old) | set(new):
+        path = f"{prefix}{key}"
+        before, after = old.get(key), new.get(key)
+        if before == after:
+            continue
+        if max_depth > 1 and isinstance(before, dict) and isinstance(after, dict):
+            changed.update(diff_fields(before, after, f"{path}/", max_depth - 1))
+        else:
+            changed[path] = after
+    return changed
+
+
+def apply_fields(record, changed):
+    """A copy of record with the {path: value} changes applied (None deletes, like an RTDB update)"""
+    result = _copy_dicts(record or {})
+    for path, value in changed.items():
+        *parents, last = path.split("/")
+        node = result
+        for key in parents:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+        if value is None:
+            node.pop(last, None)
+        else:
+            node[last] = _copy_dicts(value)
+    return result
+
+
+def merge_fields(older, newer):
+    """
+    One {path: value} patch with the effect of applying older, then newer.
+
+    A newer path replaces older paths at or below it; a newer path below an
+    older one is folded into that older value.
+    """
+    merged = dict(older or {})
+    for path, value in newer.items():
+        for old_path in list(merged):
+            if old_path == path or old_path.startswith(f"{path}/"):
+                del merged[old_path]
+            elif path.startswith(f"{old_path}/") and isinstance(merged[old_path], dict):
+                merged[old_path] = apply_fields(merged[old_path], {path[len(old_path) + 1:]: value})
+                break
+        else:
+            merged[path] = value
+    return merged
+
+
+def _copy_dicts(value):
+    if isinstance(value, dict):
+        return {key: _copy_dicts(child) for key, child in value.items()}
+    return value
+
+
+class FieldDiffAutosaver:
+    def __init__(self, send_fn, debounce_seconds=2.0, max_backoff=60.0, name="autosave"):
+        """
+        Parameters:
+        - send_fn: called as send_fn(key, state, changed_fields, context); raising keeps the state pending
+        - debounce_seconds: how long changes are coalesced before they are sent
+        - max_backoff: longest delay in seconds between retries of a failing save
+        """
+        self.send_fn = send_fn
+        self.debounce_seconds = debounce_seconds
+        self.max_backoff = max_backoff
+        self.name = name
+
+        self._lock = threading.Lock()
+        # Serialises sends so an older state never lands after a newer one
+        self._flush_lock = threading.Lock()
+        self._persisted = {}
+        self._pending = {}
+        self._timer = None
+        self._retry_delay = 0.0
+
+        self._stats = {
+            "changes": 0,
+            "saves": 0,
+            "fields_sent": 0,
+            "unchanged_skipped": 0,
+            "coalesced": 0,
+            "failed_saves": 0,
+        }
+
+    def update(self, key, state, context=None, force=False):
+        """
+        Record the current state for key.
+
+        Returns:
+        - True if the state differs from what was last persisted
+        """
+        with self._lock:
+            self._stats["changes"] += 1
+            if state == self._persisted.get(key):
+                self._pending.pop(key, None)
+                self._stats["unchanged_skipped"] += 1
+                if not force:
+                    return False
+            else:
+                if key in self._pending:
+                    self._stats["coalesced"] += 1
+                self._pending[key] = (state, context)
+                if not force and self._timer is None:
+                    self._arm(self.debounce_seconds)
+
+        if force:
+            self.flush()
+        return True
+
+    def _arm(self, delay):
+        """Start the timer that runs flush after delay seconds. Call with _lock held."""
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.name = self.name
+        self._timer.start()
+
+    def flush(self):
+        """Send everything pending now. Returns the number of keys saved."""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                batch = self._pending
+                self._pending = {}
+
+            saved = 0
+            failed = False
+            for key, (state, context) in batch.items():
+                changed = diff_fields(self._persisted.get(key), state)
+                if not changed:
+                    continue
+                try:
+                    self.send_fn(key, state, changed, context)
+                except Exception as e:
+                    print(f"⚠️ {self.name}: save of {key} failed, will retry: {e}")
+                    with self._lock:
+                        self._stats["failed_saves"] += 1
+                        self._pending.setdefault(key, (state, context))
+                    failed = True
+                    continue
+
+                with self._lock:
+                    self._persisted[key] = state
+                    self._stats["saves"] += 1
+                    self._stats["fields_sent"] += len(changed)
+                saved += 1
+
+            with self._lock:
+                if failed:
+                    # Retry on our own: the user may not touch the form again
+                    self._retry_delay = min(self.max_backoff, max(self.debounce_seconds, self._retry_delay * 2))
+                    if self._timer is None:
+                        self._arm(self._retry_delay)
+                else:
+                    self._retry_delay = 0.0
+            return saved
+
+    def stats(self):
+        """Counters, including how many changes never became a save"""
+        with self._lock:
+            stats = {**self._stats, "pending": len(self._pending)}
+        stats["saves_avoided"] = stats["changes"] - stats["saves"] - stats["pending"]
+        return stats
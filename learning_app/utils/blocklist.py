@@ -0,0 +1,152 @@
+"""
+Append-only blocklist of images marked offensive.
+
+Every flag is one JSON line appended to offensive_images.jsonl. Each server
+process loads the log once into a set of blocked keys (image id and image
+URL) and afterwards only reads the bytes appended since its last look, so
+flags from other sessions and processes show up within REFRESH_INTERVAL
+seconds without ever re-reading or rewriting the whole file.
+"""
+import json
+import os
+import threading
+import time
+
+from learning_app.utils.image_ids import PLACEHOLDER_HOSTS
+
+OFFENSIVE_DIR = "learning_app/output/offensive_images"
+BLOCKLIST_PATH = os.path.join(OFFENSIVE_DIR, "offensive_images.jsonl")
+LEGACY_JSON_PATH = os.path.join(OFFENSIVE_DIR, "offensive_images.json")
+REFRESH_INTERVAL = 2.0
+
+# Item fields that identify an image; a hit on any of them blocks the item
+KEY_FIELDS = ("id", "image_id", "image_filename", "image", "image_url", "url")
+
+
+def item_keys(item):
+    # Placeholder URLs are shared by many items and must never block all of them
+    return [
+        item[field] for field in KEY_FIELDS
+        if item.get(field) and not any(host in str(item[field]) for host in PLACEHOLDER_HOSTS)
+    ]
+
+
+class Blocklist:
+    def __init__(self, path=BLOCKLIST_PATH, refresh_interval=REFRESH_INTERVAL, seed_from=LEGACY_JSON_PATH):
+        """
+        Parameters:
+        - path: the JSONL log
+        - refresh_interval: minimum seconds between checks for lines appended by others
+        - seed_from: legacy JSON list imported once when the log does not exist yet
+        """
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._offset = 0
+        self._last_refresh = 0.0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if not os.path.exists(path) and seed_from and os.path.exists(seed_from):
+            self._seed(seed_from)
+        self.refresh(force=True)
+
+    def _seed(self, legacy_path):
+        try:
+            with open(legacy_path, "r") as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return
+        with open(self.path, "a") as f:
+            for entry in entries:
+                if isinstance(entry, dict):
+                    f.write(json.dumps(entry) + "\n")
+        print(f"✅ Imported {len(entries)} blocked images from {legacy_path} into {self.path}")
+
+    def refresh(self, force=False):
+        """Read whatever was appended to the log since the last refresh"""
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        with self._lock:
+            self._last_refresh = now
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                return
+            if size < self._offset:
+                # The log was replaced or truncated: start over
+                self._keys = set()
+                self._offset = 0
+            if size == self._offset:
+                return
+
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read(size - self._offset)
+            # Leave a half-written last line for the next refresh
+            complete = chunk[:chunk.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                try:
+                    self._keys.update(item_keys(json.loads(line)))
+                except (json.JSONDecodeError, AttributeError):
+                    continue
+            self._offset += len(complete)
+
+    def add(self, entry):
+        """Append one flag to the log and block its keys in this process right away"""
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        # O_APPEND keeps concurrent single-line writes from different processes whole
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._keys.update(item_keys(entry))
+
+    def is_blocked(self, item):
+        """O(1) check of an image item (or plain id/URL string) against the blocklist"""
+        self.refresh()
+        if isinstance(item, str):
+            return item in self._keys
+        return any(key in self._keys for key in item_keys(item))
+
+    def filter(self, items):
+        """items without the blocked ones"""
+        self.refresh()
+        keys = self._keys
+        return [item for item in items if not any(key in keys for key in item_keys(item))]
+
+    def next_allowed(self, items, index, step=1):
+        """
+        The nearest index at or after index (before it, for step=-1) whose item is not blocked.
+
+        Falls back to searching forward; returns len(items) if nothing is left.
+        """
+        self.refresh()
+        keys = self._keys
+        for direction in ((step, 1) if step < 0 else (1,)):
+            i = index
+            while 0 <= i < len(items):
+                if not any(key in keys for key in item_keys(items[i])):
+                    return i
+                i += direction
+        return len(items)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+_blocklist = None
+_blocklist_lock = threading.Lock()
+
+
+def get_blocklist():
+    """The process-wide blocklist, loaded on first use"""
+    global _blocklist
+    if _blocklist is None:
+        with _blocklist_lock:
+            if _blocklist is None:
+                _blocklist = Blocklist()
+    return _blocklist
@@ -1,4 +1,5 @@
 import os
+import threading
 import toml
 
 # Define development mode flag
@@ -71,8 +72,18 @@ def load_environment():
         print(f"⚠️ Error loading environment: {e}")
         return False
 
-# Load environment on module import
-environment_loaded = load_environment()
+# Loaded lazily (once per process) by ensure_environment() instead of on import
+environment_loaded = None
+_environment_lock = threading.Lock()
+
+def ensure_environment():
+    """Run load_environment() the first time it is needed and remember the result"""
+    global environment_loaded
+    if environment_loaded is None:
+        with _environment_lock:
+            if environment_loaded is None:
+                environment_loaded = load_environment()
+    return environment_loaded
 
 def get_firebase_credentials():
     """Get the Firebase credentials dictionary from Streamlit secrets or local file"""
@@ -109,10 +120,26 @@ def get_firebase_database_url():
     return os.getenv("FIREBASE_DATABASE_URL", 
                      "https://ill-co-p3-learns-default-rtdb.firebaseio.com")
 
+def get_firebase_storage_bucket():
+    """Get the Firebase Storage bucket name from environment variables"""
+    return os.getenv("FIREBASE_STORAGE_BUCKET", "ill-co-p3-learns.firebasestorage.app")
+
 def get_openai_api_key():
     """Get the OpenAI API key from environment variables"""
     return os.getenv("OPENAI_API_KEY")
 
 def get_google_books_api_key():
     """Get the Google Books API key from environment variables"""
-    return os.getenv("GOOGLE_BOOKS_API_KEY")
\ No newline at end of file
+    return os.getenv("GOOGLE_BOOKS_API_KEY")
+
+def get_tag_backend_name():
+    """Which storage backend firebase_service uses: rtdb (default), memory or sqlite"""
+    return os.getenv("TAG_BACKEND", "rtdb").lower()
+
+def get_tag_backend_path():
+    """SQLite file used when TAG_BACKEND=sqlite"""
+    return os.getenv("TAG_BACKEND_PATH", "learning_app/output/tag_backend.sqlite3")
+
+def get_local_tag_store_name():
+    """Local tag store used by the tagging UI: sqlite (default) or jsonl"""
+    return os.getenv("LOCAL_TAG_STORE", "sqlite").lower()
\ No newline at end of file
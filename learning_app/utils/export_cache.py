@@ -0,0 +1,82 @@
+"""
+Lazily built, cached export files for the tagging UI's download buttons.
+
+Nothing is generated until somebody asks for a download. The export is then
+streamed chunk by chunk from the local tag store into a file under
+EXPORT_CACHE_DIR, named after the store's cache key (version + file
+mtime/size), and reused by every session and process until the store
+changes again. Older files for the same format are removed once a newer one
+is written.
+"""
+import hashlib
+import os
+import threading
+
+from learning_app.utils.local_tag_store import csv_columns, get_local_tag_store, iter_csv_chunks, iter_json_chunks
+
+EXPORT_CACHE_DIR = "learning_app/output/exports/cache"
+EXPORT_FORMATS = {"csv", "json"}
+
+_build_locks = {kind: threading.Lock() for kind in EXPORT_FORMATS}
+_stats = {"hits": 0, "builds": 0}
+
+
+def store_cache_key(store):
+    """Changes whenever the store is written, in this process or another one"""
+    try:
+        stat = os.stat(store.path)
+        file_part = f"{stat.st_size}-{stat.st_mtime_ns}"
+    except OSError:
+        file_part = "missing"
+    return hashlib.sha1(f"{store.path}|{store.version}|{file_part}".encode("utf-8")).hexdigest()[:16]
+
+
+def _export_chunks(kind, store):
+    if kind == "json":
+        return iter_json_chunks(store.iter_records())
+    # First pass only collects the column names, the second one writes rows
+    return iter_csv_chunks(store.iter_records(), csv_columns(store.iter_records()))
+
+
+def get_export_file(kind, store=None):
+    """
+    Path of an up-to-date export file, building it if the store changed.
+
+    Parameters:
+    - kind: "csv" or "json"
+    - store: local tag store (defaults to get_local_tag_store())
+
+    Returns:
+    - Path to the export file
+    """
+    if kind not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {kind}")
+    store = store or get_local_tag_store()
+    prefix = f"tagged_results_export_{kind}_"
+
+    with _build_locks[kind]:
+        path = os.path.join(EXPORT_CACHE_DIR, f"{prefix}{store_cache_key(store)}.{kind}")
+        if os.path.exists(path):
+            _stats["hits"] += 1
+            return path
+
+        os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            for chunk in _export_chunks(kind, store):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+        _stats["builds"] += 1
+
+        for name in os.listdir(EXPORT_CACHE_DIR):
+            if name.startswith(prefix) and name.endswith(f".{kind}") and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(EXPORT_CACHE_DIR, name))
+                except OSError:
+                    pass
+        return path
+
+
+def get_export_cache_stats():
+    """Cache hits and builds in this process"""
+    return dict(_stats)
@@ -0,0 +1,182 @@
+"""
+Materialized view of the rejected/flagged subset of the local tag store.
+
+The view loads the failures with one indexed query on the SQLite store and
+is then kept up to date by record(), which the writers call after every put:
+
+- a new failure is appended to tagged_results_failures.csv as one CSV line;
+- an edited or cleared failure only marks the view dirty, and the file is
+  rewritten on the next flush();
+- anything else is ignored.
+
+The view remembers the store version it is in sync with. When the store has
+moved past it (another process wrote to the same store), the view reloads
+before it is read or flushed, so it never writes out or serves a CSV missing
+their rows.
+
+Every change bumps `version`, so callers (the download button) can cache
+whatever they derive from the view.
+"""
+import csv
+import io
+import json
+import os
+import threading
+
+from learning_app.utils.local_tag_store import CSV_COLUMNS, EXPORT_DIR, get_local_tag_store
+
+FAILURES_CSV_PATH = os.path.join(EXPORT_DIR, "tagged_results_failures.csv")
+
+
+def is_failure(record):
+    return bool(record.get("rejected") or record.get("flagged"))
+
+
+def failure_row(record):
+    """The CSV row for one failure, in CSV_COLUMNS order"""
+    return (
+        record.get("image_id", "unknown"),
+        record.get("text", ""),
+        record.get("rejected", False),
+        record.get("flagged", False),
+        record.get("tagger", ""),
+        json.dumps(record.get("tags", {})),
+    )
+
+
+class FailuresView:
+    def __init__(self, store, path=FAILURES_CSV_PATH):
+        """
+        Parameters:
+        - store: local tag store providing iter_failures() and version
+        - path: CSV file the view is materialized to
+        """
+        self.store = store
+        self.path = path
+        self._lock = threading.RLock()
+        self._rows = None
+        self._store_version = None
+        self._version = 0
+        self._dirty = True
+        self._csv_cache = (None, None)
+
+    def _load(self):
+        """The rows, reloaded first if the store was written to since the view last synced"""
+        store_version = self.store.version
+        if self._rows is None or store_version != self._store_version:
+            with self._lock:
+                if self._rows is None or store_version != self._store_version:
+                    rows = {
+                        record.get("image_id"): failure_row(record)
+                        for record in self.store.iter_failures()
+                    }
+                    if rows != self._rows:
+                        # The CSV may miss rows written elsewhere
+                        self._dirty = self._dirty or self._rows is not None
+                        self._rows = rows
+                        self._version += 1
+                    self._store_version = store_version
+        return self._rows
+
+    @property
+    def version(self):
+        """Increases whenever the set of failure rows changes"""
+        self._load()
+        return self._version
+
+    def __len__(self):
+        return len(self._load())
+
+    def record(self, records, since_version):
+        """
+        Fold records this process just stored into the view.
+
+        Parameters:
+        - records: the stored records
+        - since_version: store.version read right before they were stored,
+          under the same write lock; if the view was not in sync with it,
+          something else wrote too and the view reloads instead
+        """
+        with self._lock:
+            if self._rows is None or since_version != self._store_version:
+                self._load()
+                return
+            self._store_version = self.store.version
+            for record in records:
+                self._fold(record)
+
+    def _fold(self, record):
+        rows = self._rows
+        image_id = record.get("image_id")
+        row = failure_row(record) if is_failure(record) else None
+
+        previous = rows.get(image_id)
+        if row == previous:
+            return
+        self._version += 1
+
+        if row is None:
+            del rows[image_id]
+            self._dirty = True
+            return
+
+        rows[image_id] = row
+        if previous is not None or self._dirty or not os.path.exists(self.path):
+            self._dirty = True
+            return
+
+        # New failure on a clean file: one appended line, no rebuild
+        try:
+            with open(self.path, "a", newline="") as f:
+                csv.writer(f).writerow(row)
+        except OSError as e:
+            print(f"⚠️ Could not append to {self.path}: {e}")
+            self._dirty = True
+
+    def flush(self):
+        """Rewrite the CSV if it is dirty or missing; returns True if it was written"""
+        rows = self._load()
+        with self._lock:
+            if not self._dirty and os.path.exists(self.path):
+                return False
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(CSV_COLUMNS)
+                writer.writerows(rows.values())
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            return True
+
+    def csv_text(self):
+        """The view as CSV text, rebuilt only when the version changes"""
+        version = self.version
+        cached_version, text = self._csv_cache
+        if cached_version == version:
+            return text
+
+        with self._lock:
+            rows = self._load()
+            version = self._version
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(CSV_COLUMNS)
+            writer.writerows(rows.values())
+            text = buffer.getvalue()
+            self._csv_cache = (version, text)
+        return text
+
+
+_view = None
+_view_lock = threading.Lock()
+
+
+def get_failures_view():
+    """The process-wide failures view over get_local_tag_store()"""
+    global _view
+    if _view is None:
+        with _view_lock:
+            if _view is None:
+                _view = FailuresView(get_local_tag_store())
+    return _view
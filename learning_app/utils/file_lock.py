@@ -0,0 +1,94 @@
+"""
+Advisory, cross-process file locks.
+
+Several Streamlit server processes can share one output folder. Writers that
+touch the same local files (the tag store, the failures CSV, ...) take an
+exclusive lock on a sidecar ".lock" file first so their writes never
+interleave. Uses fcntl.flock on POSIX and msvcrt.locking on Windows; the
+lock is also a threading lock, so it is safe to share within a process.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    def __init__(self, path, timeout=30.0, poll_interval=0.05):
+        """
+        Parameters:
+        - path: lock file to create next to the protected file(s)
+        - timeout: seconds to wait for the lock before raising TimeoutError
+        - poll_interval: seconds between attempts while another process holds it
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self.wait_seconds = 0.0
+
+    def _try_lock(self, fd):
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self, fd):
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def acquire(self):
+        started = time.monotonic()
+        if not self._thread_lock.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Timed out waiting for {self.path}")
+        if self._depth:
+            # Re-entrant within the thread that already holds the file lock
+            self._depth += 1
+            return self
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            while not self._try_lock(fd):
+                if time.monotonic() - started > self.timeout:
+                    os.close(fd)
+                    raise TimeoutError(f"Timed out waiting for {self.path}")
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+        self._fd = fd
+        self._depth = 1
+        self.wait_seconds += time.monotonic() - started
+        return self
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            try:
+                self._unlock(fd)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
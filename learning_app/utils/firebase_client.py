@@ -0,0 +1,72 @@
+"""
+Single, lazily initialised Firebase app shared by auth and firebase_service.
+
+Nothing touches credentials or the network at import time. The first call to
+get_firebase_app() loads the environment once, builds the credentials and
+initialises the app; every later call (from any thread or Streamlit session)
+gets the same app back. firebase_admin keeps one HTTP session per app and
+service, so sharing the app means DB, Auth and Storage calls all reuse the
+same pooled connections.
+"""
+import threading
+import time
+
+import firebase_admin
+from firebase_admin import credentials, storage
+
+from learning_app.utils.config import (
+    ensure_environment,
+    get_firebase_credentials,
+    get_firebase_database_url,
+    get_firebase_storage_bucket,
+)
+
+_app = None
+_bucket = None
+_lock = threading.Lock()
+_init_seconds = None
+
+
+def get_firebase_app():
+    """Return the shared Firebase app, initialising it on first use"""
+    global _app, _init_seconds
+    if _app is not None:
+        return _app
+
+    with _lock:
+        if _app is not None:
+            return _app
+
+        started = time.perf_counter()
+        if firebase_admin._apps:
+            # Someone else (a notebook, a script) already initialised the default app
+            _app = firebase_admin.get_app()
+        else:
+            ensure_environment()
+            cred_dict = get_firebase_credentials()
+            if not cred_dict:
+                raise ValueError("Missing Firebase credentials")
+
+            _app = firebase_admin.initialize_app(credentials.Certificate(cred_dict), {
+                "databaseURL": get_firebase_database_url(),
+                "storageBucket": get_firebase_storage_bucket(),
+            })
+        _init_seconds = time.perf_counter() - started
+        print(f"✅ Firebase initialized in {_init_seconds:.2f}s")
+        return _app
+
+
+def get_storage_bucket():
+    """The shared Storage bucket handle"""
+    global _bucket
+    if _bucket is None:
+        app = get_firebase_app()
+        with _lock:
+            if _bucket is None:
+                _bucket = storage.bucket(app=app)
+    return _bucket
+
+
+def get_init_seconds():
+    """Seconds spent initialising Firebase in this process (None until it happens)"""
+    return _init_seconds
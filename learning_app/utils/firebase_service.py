@@ -1,33 +1,82 @@
 import os
 import json
-import firebase_admin
-from firebase_admin import credentials, db, storage, firestore
+import random
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 from datetime import datetime
-from learning_app.utils.config import get_firebase_credentials, get_firebase_database_url
+from learning_app.utils.config import get_tag_backend_name, get_tag_backend_path
+from learning_app.utils.firebase_client import get_firebase_app, get_storage_bucket
+from learning_app.utils.tag_backends import create_backend, server_increment
+from learning_app.utils.storage_uploader import upload_image
+from learning_app.utils.tag_outbox import TagOutbox
+from learning_app.utils.write_buffer import CoalescingWriteBuffer
+from learning_app.utils.tag_mirror import TagMirror
+from learning_app.utils.autosave import apply_fields, diff_fields, merge_fields
 
-# Initialize Firebase Admin SDK
-if not firebase_admin._apps:
-    try:
-        # Get Firebase credentials directly from the config module
-        cred_dict = get_firebase_credentials()
-        db_url = get_firebase_database_url()
-        
-        if not cred_dict:
-            raise ValueError("Missing Firebase credentials")
-            
-        cred = credentials.Certificate(cred_dict)
-        firebase_admin.initialize_app(cred, {
-            "databaseURL": db_url
-        })
-        print("✅ Firebase Admin SDK initialized")
-    except Exception as e:
-        print(f"❌ Failed to initialize Firebase: {e}")
+# === STORAGE BACKEND ===
+# All database reads and writes below go through this backend so the same
+# code runs against RTDB, an in-memory tree or a local SQLite file
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Return the configured storage backend (see config.get_tag_backend_name)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = get_tag_backend_name()
+                # Only the RTDB backend needs Firebase; it is initialised here, on first use
+                app = get_firebase_app() if name == "rtdb" else None
+                _backend = create_backend(name, sqlite_path=get_tag_backend_path(), app=app)
+    return _backend
+
+def set_backend(backend):
+    """Swap the storage backend, e.g. a MemoryBackend for load tests and benchmarks"""
+    global _backend, _tag_mirror
+    _backend = backend
+    if _tag_mirror is not None:
+        _tag_mirror.close()
+        _tag_mirror = None
+
+# Number of shards for the global tagged-images counter. Every first tag on a
+# new image bumps it, so it is the only counter with real write contention.
+STATS_TOTAL_SHARDS = 8
+
+# Tag saves go to a local SQLite outbox first; a replay thread drains it to
+# Firebase every TAG_WRITE_FLUSH_MS, or as soon as TAG_WRITE_BATCH_SIZE rows
+# are waiting. Once TAG_WRITE_MAX_PENDING rows are queued, saves of new tags
+# wait up to TAG_WRITE_ENQUEUE_TIMEOUT seconds for the replay to catch up.
+TAG_OUTBOX_PATH = os.getenv("TAG_OUTBOX_PATH", "learning_app/output/firebase_outbox.sqlite3")
+TAG_WRITE_FLUSH_MS = int(os.getenv("TAG_WRITE_FLUSH_MS", "500"))
+TAG_WRITE_BATCH_SIZE = int(os.getenv("TAG_WRITE_BATCH_SIZE", "500"))
+TAG_WRITE_MAX_PENDING = int(os.getenv("TAG_WRITE_MAX_PENDING", "10000"))
+TAG_WRITE_ENQUEUE_TIMEOUT = 10
+TAG_WRITE_MAX_BACKOFF = float(os.getenv("TAG_WRITE_MAX_BACKOFF", "60"))
+# Parallel reads of /tags/{image_id} for the images in each batch
+TAG_STATE_READ_CONCURRENCY = 16
+
+# Paginated reads of /tags: images per page and pages fetched in parallel
+TAG_PAGE_SIZE = 200
+TAG_READ_CONCURRENCY = 4
+
+# Serve tag reads from a process-wide in-memory mirror kept live by one
+# listen() stream; set TAG_MIRROR=0 to always read from the network
+TAG_MIRROR_ENABLED = os.getenv("TAG_MIRROR", "1").lower() in ("1", "true", "yes")
 
 # === SAVE TAG TO FIREBASE ===
-def save_tag_to_firebase(image_id, tag_data):
+def save_tag_to_firebase(image_id, tag_data, user=None):
+    """
+    Queue a tag save. tag_data is a {field path: value} patch on the user's tag
+    for image_id: a whole tag entry, or only the fields that changed
+    ("tags/primary_element", ...), as the autosaver sends them.
+    """
     try:
-        user = st.session_state.get("user", {})
+        # Callers off the script thread (autosave timers) pass the user explicitly
+        user = user or st.session_state.get("user", {})
         uid = user.get("uid")
         display_name = user.get("display_name")
 
@@ -40,42 +89,319 @@ def save_tag_to_firebase(image_id, tag_data):
         clean_image_id = image_id.replace(".", "_").replace("/", "_").replace("#", "_").replace("$", "_")
         
         # Inject UID and display name into tag data
-        tag_entry = {
+        tag_patch = {
             "uid": uid,
             "display_name": display_name,
             "timestamp": datetime.utcnow().isoformat(),
             **tag_data
         }
 
-        # Save under /tags/{image_id}/{uid} - using the cleaned image_id
-        ref = db.reference(f"tags/{clean_image_id}/{uid}")
-        ref.set(tag_entry)
-        print(f"✅ Tag saved for {clean_image_id} by {display_name} ({uid})")
+        # Only append to the local outbox here; the replay thread does the network round trip
+        if not get_tag_writer().append(clean_image_id, uid, tag_patch, timeout=TAG_WRITE_ENQUEUE_TIMEOUT):
+            print(f"❌ Tag outbox full — dropped tag for {clean_image_id} by {display_name} ({uid})")
+            return False
+
+        mirror = get_tag_mirror()
+        if mirror is not None:
+            mirror.apply_local(clean_image_id, uid, tag_patch)
+        return True
 
     except Exception as e:
         print(f"❌ Failed to save tag: {e}")
 
-def save_tag_to_firebase(image_id, data):
-    """Save tag data to Firebase, with fallback to local storage if Firebase is unavailable"""
+# === TAG OUTBOX / REPLAY WRITER ===
+_tag_writer = None
+_tag_writer_lock = threading.Lock()
+
+_write_stats = {"full_writes": 0, "field_writes": 0, "paths_sent": 0}
+
+def get_tag_writer():
+    """Return the process-wide tag outbox, starting its replay thread on first use"""
+    global _tag_writer
+    if _tag_writer is None:
+        with _tag_writer_lock:
+            if _tag_writer is None:
+                _tag_writer = TagOutbox(
+                    TAG_OUTBOX_PATH,
+                    write_tag_batch,
+                    batch_size=TAG_WRITE_BATCH_SIZE,
+                    interval_ms=TAG_WRITE_FLUSH_MS,
+                    max_backoff=TAG_WRITE_MAX_BACKOFF,
+                    max_pending=TAG_WRITE_MAX_PENDING,
+                    # Patches queued for the same tag are folded into one
+                    merge_fn=merge_fields,
+                    name="firebase-tag-outbox",
+                )
+                atexit.register(flush_tag_writes)
+    return _tag_writer
+
+def _read_image_tags(image_id):
+    """Every user's stored tag on one image ({uid: tag}), in one read"""
+    return get_backend().get(f"tags/{image_id}") or {}
+
+def write_tag_batch(batch):
+    """
+    Write a {(image_id, uid): tag patch} batch as one multi-path update.
+
+    The tags, their /user_tags copies, the votes and every /stats and
+    /aggregates change go into that same update, the counters as server-side
+    increments, so a batch costs no transactions. Before it, /tags/{image_id}
+    is read once per image in the batch (in parallel): the stored tags tell
+    whether a tag is new, which vote was counted for it (/votes always holds
+    extract_vote of the stored tag) and the tag each patch applies to; only
+    the fields that end up different are sent. Two processes saving the same user's tag at the same
+    moment can count it twice; rebuild-stats and rebuild-aggregates correct that.
+
+    Raising leaves the rows in the outbox and makes the replay thread back off.
+    """
+    image_ids = list({image_id for image_id, _ in batch})
+    with ThreadPoolExecutor(max_workers=min(TAG_STATE_READ_CONCURRENCY, len(image_ids))) as pool:
+        stored_tags = dict(zip(image_ids, pool.map(_read_image_tags, image_ids)))
+
+    updates = {}
+    counters = {}
+    counted_images = set()
+    for key, tag_patch in batch.items():
+        image_id, uid = key
+        image_tags = stored_tags[image_id]
+        stored = image_tags.get(uid) if isinstance(image_tags.get(uid), dict) else None
+        tag_entry = apply_fields(stored, tag_patch)
+        if stored is not None:
+            created_at = stored.get("created_at") or stored.get("timestamp")
+            old_vote = extract_vote(stored)
+        else:
+            created_at = tag_entry["timestamp"]
+            old_vote = None
+            _add_count(counters, f"stats/users/{uid}", 1)
+            _add_count(counters, f"stats/images/{image_id}", 1)
+            if not image_tags and image_id not in counted_images:
+                # First tag on this image: one more tagged image overall
+                counted_images.add(image_id)
+                shard = random.randrange(STATS_TOTAL_SHARDS)
+                _add_count(counters, f"stats/total_tagged/shard_{shard}", 1)
+
+        vote = extract_vote(tag_entry)
+        if vote != old_vote:
+            updates[f"votes/{image_id}/{uid}"] = vote
+            for path, delta in vote_delta(old_vote, vote).items():
+                _add_count(counters, f"aggregates/{image_id}/{path}", delta)
+
+        entry = {**tag_entry, "created_at": created_at}
+        if stored is None:
+            tag_update = build_tag_update(image_id, uid, entry)
+            _write_stats["full_writes"] += 1
+        else:
+            # Fields this patch did not touch keep whatever is stored (per-field last writer wins)
+            tag_update = build_tag_field_update(image_id, uid, diff_fields(stored, entry))
+            _write_stats["field_writes"] += 1
+        updates.update(tag_update)
+
+    for path, delta in counters.items():
+        if delta:
+            updates[path] = server_increment(delta)
+    if updates:
+        get_backend().update(updates)
+    _write_stats["paths_sent"] += len(updates)
+    print(f"✅ Saved {len(batch)} tags to Firebase ({len(updates)} paths)")
+
+def flush_tag_writes(timeout=10):
+    """
+    Try to replay all pending tags now (call on logout and at exit).
+
+    Tags that cannot be sent stay in the outbox and are replayed on the next run.
+    Queued queue cursors are written too, so the next session resumes in place.
+    """
+    flush_queue_cursors()
+    if _tag_writer is None:
+        return 0
+    return _tag_writer.flush(timeout)
+
+def replay_tag_outbox():
+    """Drain a leftover outbox, e.g. after the app was stopped during an outage"""
+    replayed = get_tag_writer().flush(timeout=600)
+    print(f"✅ Replayed {replayed} tags, {_tag_writer.pending()} still pending")
+    return replayed
+
+def get_tag_writer_stats():
+    """Counters for the tag outbox, including how many writes were coalesced away"""
+    if _tag_writer is None:
+        return {}
+    return {**_tag_writer.stats(), **_write_stats}
+
+def build_tag_update(image_id, uid, tag_entry):
+    """
+    Build the multi-path update that writes one tag.
+
+    The tag lives under /tags/{image_id}/{uid}; a copy is kept under
+    /user_tags/{uid}/{image_id} so per-user reads only touch that user's subtree.
+    """
+    return {
+        f"tags/{image_id}/{uid}": tag_entry,
+        f"user_tags/{uid}/{image_id}": tag_entry,
+    }
+
+def build_tag_field_update(image_id, uid, changed):
+    """Same two locations as build_tag_update, but only the {field path: value} pairs in changed"""
+    updates = {}
+    for field, value in changed.items():
+        updates[f"tags/{image_id}/{uid}/{field}"] = value
+        updates[f"user_tags/{uid}/{image_id}/{field}"] = value
+    return updates
+
+# === TAG COUNTERS ===
+def _add_count(counters, path, delta):
+    counters[path] = counters.get(path, 0) + delta
+
+# === PER-IMAGE VOTE AGGREGATES ===
+# Tag fields counted per value in /aggregates/{image_id}
+VOTE_FIELDS = ["primary_element", "secondary_element", "primary_principle", "secondary_principle"]
+# Boolean flags counted in /aggregates/{image_id}. Rejected/flagged images are
+# only recorded in the local store and the blocklist, never in /tags, so
+# they have no aggregate count.
+VOTE_FLAGS = ["irrelevant"]
+
+def extract_vote(tag_entry):
+    """
+    The compact vote (elements, principles, flags) carried by one tag entry.
+
+    Always holds "voted": True, so a vote with nothing selected is still stored:
+    RTDB drops {} as null, which would read back as "this user never voted".
+    """
+    tags = tag_entry.get("tags") if isinstance(tag_entry.get("tags"), dict) else tag_entry
+    vote = {"voted": True}
+    for field in VOTE_FIELDS:
+        value = tags.get(field)
+        if value and value != "None":
+            vote[field] = value
+    for flag in VOTE_FLAGS:
+        if tags.get(flag) or tag_entry.get(flag):
+            vote[flag] = True
+    return vote
+
+def _apply_vote(aggregate, vote, sign):
+    aggregate["votes"] = aggregate.get("votes", 0) + sign
+    for field in VOTE_FIELDS:
+        value = vote.get(field)
+        if value:
+            counts = aggregate.setdefault(field, {})
+            counts[value] = counts.get(value, 0) + sign
+            if counts[value] <= 0:
+                del counts[value]
+            if not counts:
+                del aggregate[field]
+    for flag in VOTE_FLAGS:
+        if vote.get(flag):
+            aggregate[flag] = aggregate.get(flag, 0) + sign
+            if aggregate[flag] <= 0:
+                del aggregate[flag]
+
+def vote_delta(old_vote, new_vote):
+    """{path under /aggregates/{image_id}: change} for moving one user's vote from old_vote to new_vote"""
+    delta = {}
+    for vote, sign in ((old_vote, -1), (new_vote, +1)):
+        if not vote:
+            continue
+        _add_count(delta, "votes", sign)
+        for field in VOTE_FIELDS:
+            value = vote.get(field)
+            if value:
+                _add_count(delta, f"{field}/{value}", sign)
+        for flag in VOTE_FLAGS:
+            if vote.get(flag):
+                _add_count(delta, flag, sign)
+    return {path: change for path, change in delta.items() if change}
+
+def _prune_aggregate(aggregate):
+    """aggregate without the zero counts server-side decrements leave behind (None if nobody votes)"""
+    if not isinstance(aggregate, dict) or (aggregate.get("votes") or 0) <= 0:
+        return None
+    pruned = {}
+    for key, value in aggregate.items():
+        if isinstance(value, dict):
+            counts = {option: count for option, count in value.items() if count and count > 0}
+            if counts:
+                pruned[key] = counts
+        elif value and value > 0:
+            pruned[key] = value
+    return pruned
+
+def get_image_aggregate(image_id):
+    """Vote counts for one image: per element/principle value, plus irrelevant/votes"""
     try:
-        # Try to use Firebase first
-        # Your existing Firebase code here...
-        pass
+        return _prune_aggregate(get_backend().get(f"aggregates/{image_id}")) or {}
     except Exception as e:
-        print(f"⚠️ Firebase save failed, using local storage instead: {e}")
-        # Fall back to saving locally
-        from ..scripts.image_tagging_ui import save_current_tags
-        return save_current_tags(
-            {"image_id": image_id, "image": data.get("image_url"), "text": data.get("text")},
-            data.get("tags", {}),
-            data.get("tagger", "unknown")
-        )
+        print(f"⚠️ Failed to fetch aggregate for {image_id}: {e}")
+        return {}
+
+def get_all_aggregates():
+    """{image_id: aggregate} for every tagged image — O(images), not O(images × users)"""
+    try:
+        aggregates = get_backend().get("aggregates") or {}
+        return {
+            image_id: pruned for image_id, pruned in
+            ((image_id, _prune_aggregate(aggregate)) for image_id, aggregate in aggregates.items())
+            if pruned
+        }
+    except Exception as e:
+        print(f"⚠️ Failed to fetch aggregates: {e}")
+        return {}
+
+def rebuild_aggregates():
+    """
+    Recompute /votes and /aggregates from /tags in one pass.
+
+    Returns:
+    - Number of images with an aggregate
+    """
+    votes = {}
+    aggregates = {}
+    for image_id, uid, tag_entry in iter_all_tags():
+        if not isinstance(tag_entry, dict):
+            continue
+        vote = extract_vote(tag_entry)
+        votes.setdefault(image_id, {})[uid] = vote
+        _apply_vote(aggregates.setdefault(image_id, {}), vote, +1)
+
+    get_backend().update({"votes": votes or None, "aggregates": aggregates or None})
+    print(f"✅ Rebuilt vote aggregates for {len(aggregates)} images")
+    return len(aggregates)
+
+# === IN-MEMORY TAG MIRROR ===
+_tag_mirror = None
+_tag_mirror_lock = threading.Lock()
+
+def get_tag_mirror():
+    """Return the process-wide tag mirror (started on first use), or None when disabled"""
+    global _tag_mirror
+    backend = get_backend()
+    if not TAG_MIRROR_ENABLED or not backend.supports_listen:
+        return None
+    if _tag_mirror is None:
+        with _tag_mirror_lock:
+            if _tag_mirror is None:
+                _tag_mirror = TagMirror(lambda callback: backend.listen("tags", callback))
+                _tag_mirror.start()
+    return _tag_mirror
+
+def _fresh_mirror():
+    """The tag mirror if its data can be served right now, else None"""
+    mirror = get_tag_mirror()
+    if mirror is not None and mirror.is_fresh():
+        return mirror
+    return None
+
+def get_tag_mirror_status():
+    """Bootstrap/stream state and staleness of the tag mirror"""
+    mirror = get_tag_mirror()
+    return mirror.status() if mirror is not None else {"enabled": False}
 
 # === GET ALL TAGS FOR ONE IMAGE ===
 def get_tags_for_image(image_id):
+    mirror = _fresh_mirror()
+    if mirror is not None:
+        return mirror.get_image_tags(image_id)
     try:
-        ref = db.reference(f"tags/{image_id}")
-        return ref.get() or {}
+        return get_backend().get(f"tags/{image_id}") or {}
     except Exception as e:
         print(f"❌ Failed to fetch tags for image {image_id}: {e}")
         return {}
@@ -83,21 +409,72 @@ def get_tags_for_image(image_id):
 
 # === GET TAGS FOR CURRENT USER ===
 def get_user_tags(uid):
+    """Return {image_id: tag_data} for one user, read from the /user_tags index"""
+    mirror = _fresh_mirror()
+    if mirror is not None:
+        return mirror.get_user_tags(uid)
     try:
-        ref = db.reference("tags")
-        all_tags = ref.get() or {}
-
-        user_tags = {}
-        for image_id, tag_entries in all_tags.items():
-            if uid in tag_entries:
-                user_tags[image_id] = tag_entries[uid]
-
-        return user_tags
+        return get_backend().get(f"user_tags/{uid}") or {}
 
     except Exception as e:
         print(f"❌ Failed to fetch user tags: {e}")
         return {}
 
+def list_tagged_image_ids():
+    """All image ids under /tags, from a shallow read (keys only, no tag data)"""
+    return get_backend().list_keys("tags")
+
+def _fetch_tag_page(start_key, next_start_key):
+    """
+    Fetch the /tags children from start_key up to (not including) next_start_key.
+
+    Pages are bounded by key rather than by count, so an image added after the
+    shallow listing is read by whichever page's range it falls in instead of
+    pushing existing images off the end of a page.
+    """
+    page = get_backend().page_by_key("tags", start_key, end_key=next_start_key)
+    return [(image_id, entries) for image_id, entries in page if image_id != next_start_key]
+
+def iter_tag_pages(page_size=TAG_PAGE_SIZE, concurrency=TAG_READ_CONCURRENCY):
+    """
+    Yield /tags one page at a time as lists of (image_id, {uid: tag}) pairs.
+
+    Image ids come from a shallow read and split every page_size ids; each
+    page is fetched with order_by_key().start_at(first).end_at(next page's
+    first), so consecutive pages cover every key with no gaps, even keys added
+    after the listing. At most `concurrency` pages are in flight and they are
+    yielded in key order. Memory stays bounded by about
+    page_size * concurrency images regardless of the size of /tags.
+    """
+    image_ids = list_tagged_image_ids()
+    starts = image_ids[::page_size]
+    # The last page has no upper bound
+    bounds = zip(starts, starts[1:] + [None])
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        in_flight = deque()
+        for start_key, next_start_key in bounds:
+            in_flight.append(pool.submit(_fetch_tag_page, start_key, next_start_key))
+            if len(in_flight) >= concurrency:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def iter_all_tags(page_size=TAG_PAGE_SIZE, concurrency=TAG_READ_CONCURRENCY):
+    """
+    Stream every tag as (image_id, uid, tag_data) tuples in constant memory.
+
+    Parameters:
+    - page_size: images fetched per request
+    - concurrency: pages fetched in parallel
+    """
+    for page in iter_tag_pages(page_size, concurrency):
+        for image_id, tag_entries in page:
+            if not isinstance(tag_entries, dict):
+                continue
+            for uid, tag_data in tag_entries.items():
+                yield image_id, uid, tag_data
+
 def get_all_tags():
     """
     Retrieve all tags from Firebase (across all users and images).
@@ -111,18 +488,73 @@ def get_all_tags():
             ...
         }
     }
+
+    Built from paginated reads so it never hits the single-response size
+    limit; prefer iter_all_tags() when the whole dict is not needed.
     """
-    ref = db.reference("tags")
-    return ref.get() or {}
+    all_tags = {}
+    for image_id, uid, tag_data in iter_all_tags():
+        all_tags.setdefault(image_id, {})[uid] = tag_data
+    return all_tags
+
+# === QUEUE CURSORS ===
+# Position of each user in their own image order (see utils/permutation.py),
+# so they resume where they left off in a new session. Saves are buffered
+# (latest cursor per user wins) and written every QUEUE_CURSOR_FLUSH_MS as one
+# multi-path update, so Next/Previous never wait on the network.
+QUEUE_CURSOR_FLUSH_MS = 2000
+
+_cursor_writer = None
+_cursor_writer_lock = threading.Lock()
+
+def get_cursor_writer():
+    """Return the process-wide queue cursor buffer, starting it on first use"""
+    global _cursor_writer
+    if _cursor_writer is None:
+        with _cursor_writer_lock:
+            if _cursor_writer is None:
+                _cursor_writer = CoalescingWriteBuffer(
+                    write_queue_cursors,
+                    flush_interval_ms=QUEUE_CURSOR_FLUSH_MS,
+                    max_batch=TAG_WRITE_BATCH_SIZE,
+                    max_pending=TAG_WRITE_MAX_PENDING,
+                    name="queue-cursor-writer",
+                )
+                atexit.register(flush_queue_cursors)
+    return _cursor_writer
+
+def write_queue_cursors(batch):
+    """Write a {uid: cursor} batch as one multi-path update"""
+    get_backend().update({f"queue_cursors/{uid}": cursor for uid, cursor in batch.items()})
+
+def flush_queue_cursors():
+    if _cursor_writer is None:
+        return 0
+    try:
+        return _cursor_writer.flush()
+    except Exception as e:
+        print(f"❌ Failed to save queue cursors: {e}")
+        return 0
+
+def get_queue_cursor(uid):
+    try:
+        cursor = get_backend().get(f"queue_cursors/{uid}") or {}
+        return int(cursor.get("index", 0))
+    except Exception as e:
+        print(f"❌ Failed to load queue cursor: {e}")
+        return 0
+
+def save_queue_cursor(uid, index):
+    """Queue the user's cursor for the next background write; returns False if the buffer stayed full"""
+    cursor = {"index": index, "updated_at": datetime.utcnow().isoformat()}
+    return get_cursor_writer().put(uid, cursor, timeout=TAG_WRITE_ENQUEUE_TIMEOUT)
 
 # === OPTIONAL: Upload a file to Firebase Storage ===
 def upload_file_to_firebase_storage(local_file_path, remote_filename):
+    """Upload one image, skipping the upload if the stored blob already has the same MD5"""
     try:
-        bucket = storage.bucket()
-        blob = bucket.blob(f"images/{remote_filename}")
-        blob.upload_from_filename(local_file_path)
-        blob.make_public()
-        return blob.public_url
+        url, _, _ = upload_image(get_storage_bucket(), local_file_path, remote_filename)
+        return url
     except Exception as e:
         print(f"❌ Failed to upload file: {e}")
         return None
@@ -137,32 +569,46 @@ def get_user_tag_count(uid):
     Returns:
     - Integer count of images tagged by this user
     """
+    mirror = _fresh_mirror()
+    if mirror is not None:
+        return mirror.count_user_tags(uid)
     try:
-        ref = db.reference("tags")
-        all_tags = ref.get() or {}
-        
-        # Count images where this user has tags
-        count = 0
-        for image_id, tag_entries in all_tags.items():
-            if uid in tag_entries:
-                count += 1
-                
-        return count
+        return get_backend().get(f"stats/users/{uid}") or 0
     except Exception as e:
-        print(f"❌ Failed to count user tags: {e}")
+        print(f"⚠️ Firebase get_user_tag_count failed: {e}")
         return 0
 
-def get_user_tag_count(user_id):
-    """Get tag count for a user, with fallback if Firebase is unavailable"""
+def get_image_tag_count(image_id):
+    """Number of users who have tagged one image"""
+    mirror = _fresh_mirror()
+    if mirror is not None:
+        return mirror.count_image_tags(image_id)
     try:
-        # Try to use Firebase first
-        # Your existing Firebase code here...
-        pass
+        return get_backend().get(f"stats/images/{image_id}") or 0
     except Exception as e:
-        print(f"⚠️ Firebase get_user_tag_count failed: {e}")
-        # Fall back to local storage or return a default value
+        print(f"⚠️ Firebase get_image_tag_count failed: {e}")
         return 0
 
+def get_image_tag_counts():
+    """{image_id: number of users who tagged it} for every tagged image, from /stats/images"""
+    mirror = _fresh_mirror()
+    if mirror is not None:
+        return mirror.count_all_image_tags()
+    try:
+        return get_backend().get("stats/images") or {}
+    except Exception as e:
+        print(f"⚠️ Firebase get_image_tag_counts failed: {e}")
+        return {}
+
+def list_user_tagged_image_ids(uid):
+    """
+    Image ids one user has tagged: a shallow read of /user_tags/{uid}, plus
+    their saves still waiting in the outbox (not on the server yet)
+    """
+    tagged = list(get_backend().list_keys(f"user_tags/{uid}") or [])
+    known = set(tagged)
+    return tagged + [image_id for image_id in get_tag_writer().pending_image_ids(uid) if image_id not in known]
+
 def get_all_tag_counts():
     """
     Count the total number of unique images that have been tagged by any user
@@ -170,23 +616,80 @@ def get_all_tag_counts():
     Returns:
     - Integer count of total tagged images
     """
+    mirror = _fresh_mirror()
+    if mirror is not None:
+        return mirror.count_tagged_images()
     try:
-        ref = db.reference("tags")
-        all_tags = ref.get() or {}
-        
-        # The number of tagged images is the length of the dictionary
-        return len(all_tags)
-    except Exception as e:
-        print(f"❌ Failed to count all tags: {e}")
-        return 0
-
-def get_all_tag_counts():
-    """Get total tag count, with fallback if Firebase is unavailable"""
-    try:
-        # Try to use Firebase first
-        # Your existing Firebase code here...
-        pass
+        # A handful of shard values, summed client-side
+        shards = get_backend().get("stats/total_tagged") or {}
+        return sum(shards.values())
     except Exception as e:
         print(f"⚠️ Firebase get_all_tag_counts failed: {e}")
-        # Fall back to local storage or return a default value
         return 0
+
+def rebuild_tag_stats():
+    """
+    Recompute /stats from /tags in one pass, in case the counters drift.
+
+    Also backfills created_at on tags written before counters existed, so
+    re-saving an old tag is not counted as a new one.
+
+    Returns:
+    - The rebuilt stats dictionary
+    """
+    user_counts = {}
+    image_counts = {}
+    backfill = {}
+    for image_id, uid, tag_entry in iter_all_tags():
+        image_counts[image_id] = image_counts.get(image_id, 0) + 1
+        user_counts[uid] = user_counts.get(uid, 0) + 1
+        if isinstance(tag_entry, dict) and not tag_entry.get("created_at"):
+            backfill[f"tags/{image_id}/{uid}/created_at"] = tag_entry.get("timestamp") or datetime.utcnow().isoformat()
+
+    stats = {
+        "total_tagged": {"shard_0": len(image_counts)},
+        "users": user_counts,
+        "images": image_counts,
+    }
+    get_backend().set("stats", stats)
+    if backfill:
+        get_backend().update(backfill)
+
+    print(f"✅ Rebuilt tag stats: {len(image_counts)} images, {len(user_counts)} users, {len(backfill)} created_at backfilled")
+    return stats
+
+def rebuild_user_tag_index():
+    """
+    Rebuild /user_tags from /tags in one pass.
+
+    Only needed once for tags written before the per-user index existed,
+    or if the index is ever suspected to have drifted.
+
+    Returns:
+    - Number of (image, user) entries written to the index
+    """
+    index = {}
+    for image_id, uid, tag_entry in iter_all_tags():
+        index.setdefault(uid, {})[image_id] = tag_entry
+
+    get_backend().set("user_tags", index)
+    count = sum(len(entries) for entries in index.values())
+    print(f"✅ Rebuilt user tag index: {count} entries for {len(index)} users")
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Firebase tag maintenance commands")
+    parser.add_argument("command", choices=["rebuild-stats", "rebuild-user-index", "rebuild-aggregates", "replay-outbox"])
+    args = parser.parse_args()
+
+    if args.command == "rebuild-stats":
+        rebuild_tag_stats()
+    elif args.command == "rebuild-user-index":
+        rebuild_user_tag_index()
+    elif args.command == "rebuild-aggregates":
+        rebuild_aggregates()
+    elif args.command == "replay-outbox":
+        replay_tag_outbox()
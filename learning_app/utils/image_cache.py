@@ -0,0 +1,243 @@
+"""
+On-disk LRU cache of display-sized images, with background prefetch.
+
+The tagging UI shows remote images (Firebase Storage URLs, drive.google.com
+redirects). Instead of handing those URLs to st.image, which makes every
+Next/Previous wait on a cold full-size download, the UI asks this cache for
+the bytes:
+
+- a hit is one local file read;
+- a miss never blocks the page: it queues the download on the prefetch pool
+  and returns None, so the UI falls back to the URL for this render;
+- prefetch() queues the next few items of the user's queue on a small thread
+  pool while they tag the current one;
+- a URL whose download failed (dead link, 404, a Drive page PIL cannot open)
+  is not retried until FAILURE_TTL has passed.
+
+The cache is shared by every session in the process and evicts least
+recently used files once it is over max_bytes. stats() reports hit rate and
+fetch latency.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "learning_app/output/image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
+DISPLAY_MAX_WIDTH = 1200
+PREFETCH_AHEAD = 5
+PREFETCH_WORKERS = 4
+FETCH_TIMEOUT = 20
+FAILURE_TTL = 600
+
+
+class ImageCache:
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES,
+                 max_width=DISPLAY_MAX_WIDTH, workers=PREFETCH_WORKERS, timeout=FETCH_TIMEOUT,
+                 failure_ttl=FAILURE_TTL):
+        """
+        Parameters:
+        - cache_dir: folder holding the downscaled images
+        - max_bytes: total size at which least recently used files are evicted
+        - max_width: images wider than this are downscaled before caching
+        - workers: prefetch threads
+        - timeout: seconds per download
+        - failure_ttl: seconds before a URL whose download failed is tried again
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_width = max_width
+        self.timeout = timeout
+        self.failure_ttl = failure_ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key → size, least recently used first
+        self._bytes = 0
+        self._inflight = {}
+        self._failed = {}  # key → monotonic time after which it may be fetched again
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-prefetch")
+        self._session = requests.Session()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "prefetched": 0,
+            "fetch_errors": 0,
+            "evicted": 0,
+            "fetches": 0,
+            "total_fetch_ms": 0.0,
+            "max_fetch_ms": 0.0,
+        }
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files left by earlier runs (oldest access first)"""
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".img"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.img")
+
+    # --- fetching ---
+    def _download(self, url):
+        """Download and downscale one image; returns the bytes to cache"""
+        started = time.perf_counter()
+        response = self._session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+
+        image = Image.open(io.BytesIO(response.content))
+        image.load()
+        if image.width > self.max_width:
+            image.thumbnail((self.max_width, self.max_width * 10))
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "P"):
+            image.save(output, format="PNG", optimize=True)
+        else:
+            image.convert("RGB").save(output, format="JPEG", quality=85, optimize=True)
+        data = output.getvalue()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["fetches"] += 1
+            self._stats["total_fetch_ms"] += elapsed_ms
+            self._stats["max_fetch_ms"] = max(self._stats["max_fetch_ms"], elapsed_ms)
+        return data
+
+    def _store(self, key, data):
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            self._bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                self._stats["evicted"] += 1
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def _fetch(self, url, key):
+        try:
+            data = self._download(url)
+            self._store(key, data)
+            return data
+        except Exception as e:
+            with self._lock:
+                self._stats["fetch_errors"] += 1
+                self._failed[key] = time.monotonic() + self.failure_ttl
+            print(f"⚠️ Could not cache image {url}: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _read(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            # mtime doubles as the access time for the LRU order of the next run
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+            return None
+
+    # --- public API ---
+    def get(self, url):
+        """
+        Display-sized bytes for url if they are already cached.
+
+        A miss queues the download on the prefetch pool (unless the URL failed
+        recently) and returns at once; the bytes are served from a later rerun.
+
+        Returns:
+        - The image bytes, or None if the image is not cached yet
+        """
+        if not url:
+            return None
+        key = self.key_for(url)
+        data = self._read(key)
+        if data is not None:
+            with self._lock:
+                self._stats["hits"] += 1
+            return data
+
+        with self._lock:
+            self._stats["misses"] += 1
+        self.prefetch([url])
+        return None
+
+    def _recently_failed(self, key):
+        """Whether key failed within failure_ttl; expired failures are forgotten. Call with _lock held."""
+        retry_at = self._failed.get(key)
+        if retry_at is None:
+            return False
+        if time.monotonic() >= retry_at:
+            del self._failed[key]
+            return False
+        return True
+
+    def prefetch(self, urls):
+        """Queue downloads for urls that are not cached, on their way or recently failed"""
+        for url in urls:
+            if not url:
+                continue
+            key = self.key_for(url)
+            with self._lock:
+                if key in self._entries or key in self._inflight or self._recently_failed(key):
+                    continue
+                self._inflight[key] = self._pool.submit(self._fetch, url, key)
+                self._stats["prefetched"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = {**self._stats, "entries": len(self._entries), "bytes": self._bytes, "inflight": len(self._inflight),
+                     "failed": len(self._failed)}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["mean_fetch_ms"] = round(stats["total_fetch_ms"] / stats["fetches"], 1) if stats["fetches"] else 0.0
+        stats["total_fetch_ms"] = round(stats["total_fetch_ms"], 1)
+        stats["max_fetch_ms"] = round(stats["max_fetch_ms"], 1)
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """The process-wide image cache, shared by every Streamlit session"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ImageCache()
+    return _cache
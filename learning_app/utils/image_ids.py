@@ -0,0 +1,264 @@
+"""
+Content-addressed image IDs.
+
+Every writer (Firebase tags, the local tag store, flags, the blocklist) keys
+an image by image_id_for(item): the first 16 hex digits of the SHA-1 of the
+image's canonical reference — its filename if it has one, else its
+normalised URL, else its caption. The ID is stable across processes and
+runs (unlike hash()) and is already safe as a Firebase key.
+
+Pair normalisation (pair_schema.py) stores it as the id of each canonical
+pair, assign_image_ids() stores it as image_id on plain items, and writers
+read it back with get_image_id(item).
+
+One-off migration of data saved under the old IDs:
+    python -m learning_app.utils.image_ids migrate
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from urllib.parse import urlsplit, urlunsplit
+
+ID_LENGTH = 16
+
+# Fallback images shared by many items; they say nothing about which image it is
+PLACEHOLDER_HOSTS = ("placehold.co", "via.placeholder.com")
+
+EXPORT_JSON_PATHS = [
+    "learning_app/output/pairs/tagged_results_export.json",
+    "learning_app/output/exports/tagged_results.json",
+]
+
+
+def canonical_url(url):
+    """Lower-cased scheme and host, no fragment, no default port, surrounding whitespace stripped"""
+    parts = urlsplit(url.strip())
+    netloc = parts.netloc.lower()
+    if (parts.scheme == "http" and netloc.endswith(":80")) or (parts.scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path, parts.query, ""))
+
+
+def canonical_image_ref(item):
+    """The string an item's ID is derived from, or None if the item has nothing identifying"""
+    filename = item.get("image_filename")
+    if filename:
+        return "file:" + os.path.basename(str(filename).strip())
+
+    for field in ("image_url", "image"):
+        value = item.get(field)
+        if not value:
+            continue
+        value = str(value)
+        if "://" not in value:
+            # A bare filename stored in the URL field
+            return "file:" + os.path.basename(value.strip())
+        url = canonical_url(value)
+        if urlsplit(url).netloc not in PLACEHOLDER_HOSTS:
+            return "url:" + url
+
+    text = item.get("caption") or item.get("text")
+    return "text:" + text.strip() if text else None
+
+
+def image_id_for(item):
+    """The content-addressed ID for an image item (or tag record)"""
+    ref = canonical_image_ref(item)
+    if ref is None:
+        raise ValueError("Image item has no filename, URL or caption to derive an ID from")
+    return hashlib.sha1(ref.encode("utf-8")).hexdigest()[:ID_LENGTH]
+
+
+def get_image_id(item):
+    """The ID stored on the item (canonical pair id or image_id), computing (and storing) it if missing"""
+    image_id = item.get("image_id") or item.get("id")
+    if not image_id:
+        image_id = item["image_id"] = image_id_for(item)
+    return image_id
+
+
+def assign_image_ids(items):
+    """Store image_id on every item (in place) and return the items"""
+    for item in items:
+        if isinstance(item, dict):
+            item["image_id"] = image_id_for(item)
+    return items
+
+
+# === One-off migration ===
+# Pair files whose images the live IDs are assigned to (see dataset_interface2.load_image_pairs)
+PAIR_SOURCE_PATHS = [
+    "learning_app/output/pairs/combined_pairs_sampled_for_gpt.json",
+    "learning_app/output/pairs/combined_pairs.json",
+]
+
+
+def firebase_key(value):
+    """value as the old writers cleaned it for a Firebase path (. / # $ → _)"""
+    for char in "./#$":
+        value = value.replace(char, "_")
+    return value
+
+
+def _old_keys(item):
+    """Every key code before content-addressed IDs may have stored this pair under"""
+    values = [item.get(field) for field in ("image_filename", "filename", "image_url", "image", "image_src", "url")]
+    for value in values:
+        if not isinstance(value, str) or not value.strip():
+            continue
+        value = value.strip()
+        tail = value.rstrip("/").rsplit("/", 1)[-1]
+        yield value
+        yield tail
+        yield firebase_key(tail)
+        if "://" in value:
+            yield canonical_url(value)
+
+
+def build_id_map(pair_paths=PAIR_SOURCE_PATHS):
+    """
+    Map the keys older code stored images under to their live IDs, using the pair files.
+
+    Old keys are the raw filename or URL, the URL tail and both with "." (and
+    the other Firebase-unsafe characters) replaced by "_". Keys that point at
+    two different images are left out rather than guessed.
+
+    Returns:
+    - (old key → live ID, set of live IDs)
+    """
+    # Imported here: pair_schema itself builds on this module
+    from learning_app.utils.pair_schema import normalize_item, source_items
+
+    id_map = {}
+    ambiguous = set()
+    live_ids = set()
+    for path in pair_paths:
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"⚠️ Skipping pair file {path}: {e}")
+            continue
+        for item in source_items(data):
+            pair = normalize_item(item, path)
+            if pair is None:
+                continue
+            live_ids.add(pair["id"])
+            for key in _old_keys(item):
+                if id_map.setdefault(key, pair["id"]) != pair["id"]:
+                    ambiguous.add(key)
+    for key in ambiguous:
+        del id_map[key]
+    return id_map, live_ids
+
+
+def live_id_for(record, id_map, live_ids):
+    """
+    The live ID for a saved record, or None if it cannot be told.
+
+    A record already under a live ID is left as it is; otherwise its stored
+    key, then its filename/URL fields, are looked up in id_map.
+    """
+    image_id = record.get("image_id")
+    if image_id in live_ids:
+        return image_id
+    candidates = [image_id] + [record.get(field) for field in ("image_filename", "image_url", "image", "url")]
+    for value in candidates:
+        if not isinstance(value, str) or not value.strip():
+            continue
+        value = value.strip()
+        for key in (value, firebase_key(value), canonical_url(value) if "://" in value else None):
+            if key in id_map:
+                return id_map[key]
+    return None
+
+
+def dedupe_records(records, id_map, live_ids):
+    """
+    Re-key records to their live IDs and keep one record per image.
+
+    Records whose live ID cannot be told keep their stored image_id (or, if
+    they never had one, image_id_for()).
+
+    Returns:
+    - (records, number of duplicates dropped, number of records left unmapped);
+      the newest timestamp wins, then the later record
+    """
+    by_id = {}
+    unmapped = 0
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        new_id = live_id_for(record, id_map, live_ids)
+        if new_id is None:
+            unmapped += 1
+            new_id = record.get("image_id")
+            if not new_id:
+                try:
+                    new_id = image_id_for(record)
+                except ValueError:
+                    continue
+        record = {**record, "image_id": new_id}
+        current = by_id.get(new_id)
+        if current is None or str(record.get("timestamp") or "") >= str(current.get("timestamp") or ""):
+            by_id[new_id] = record
+    kept = list(by_id.values())
+    return kept, sum(1 for r in records if isinstance(r, dict)) - len(kept), unmapped
+
+
+def migrate_export_file(path, id_map, live_ids):
+    """Rewrite one JSON export with the live IDs and no duplicates; the original is kept as .bak"""
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"⚠️ Skipping {path}: {e}")
+        return None
+
+    records = data if isinstance(data, list) else list(data.values()) if isinstance(data, dict) else []
+    migrated, dropped, unmapped = dedupe_records(records, id_map, live_ids)
+
+    shutil.copyfile(path, path + ".bak")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(migrated, f, indent=2)
+    os.replace(tmp_path, path)
+    print(f"✅ {path}: {len(migrated)} records, {dropped} duplicates removed, {unmapped} not matched to a pair (backup in {path}.bak)")
+    return {"records": len(migrated), "duplicates": dropped, "unmapped": unmapped}
+
+
+def migrate_local_store(store, id_map, live_ids):
+    """Re-key the local tag store in place (needs a store with delete_many, i.e. SQLite)"""
+    if not hasattr(store, "delete_many"):
+        print(f"⚠️ {type(store).__name__} cannot delete records; skipping local store migration")
+        return None
+
+    records = store.records()
+    migrated, dropped, unmapped = dedupe_records(records, id_map, live_ids)
+    new_ids = {record["image_id"] for record in migrated}
+    stale_ids = [record["image_id"] for record in records if record["image_id"] not in new_ids]
+    store.put_many(migrated)
+    store.delete_many(stale_ids)
+    print(f"✅ Local tag store: {len(migrated)} records, {dropped} duplicates removed, {len(stale_ids)} old IDs replaced, {unmapped} not matched to a pair")
+    return {"records": len(migrated), "duplicates": dropped, "replaced": len(stale_ids), "unmapped": unmapped}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed image ID tools")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("paths", nargs="*", help="JSON exports to migrate (default: the known exports)")
+    parser.add_argument("--skip-store", action="store_true", help="Leave the local tag store alone")
+    parser.add_argument("--pairs", nargs="+", default=PAIR_SOURCE_PATHS, help="Pair files the live IDs come from")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        id_map, live_ids = build_id_map(args.pairs)
+        print(f"✅ {len(live_ids)} live image IDs, {len(id_map)} old keys mapped")
+        for path in args.paths or EXPORT_JSON_PATHS:
+            if os.path.exists(path):
+                migrate_export_file(path, id_map, live_ids)
+        if not args.skip_store:
+            from learning_app.utils.local_tag_store import get_local_tag_store
+            migrate_local_store(get_local_tag_store(), id_map, live_ids)
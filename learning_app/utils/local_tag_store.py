@@ -0,0 +1,416 @@
+"""
+Local tag stores for the tagging UI.
+
+Two interchangeable implementations, picked by config.get_local_tag_store_name():
+
+- SQLiteTagStore (default): one upserted row per image in a WAL-mode SQLite
+  file, indexed on image_id, uid, tagger, rejected and flagged. Safe for many
+  Streamlit sessions and server processes writing at once; failures and
+  exports are plain SQL queries.
+- JsonlTagStore: tag records are appended to a JSONL log, one line per save.
+  An in-memory index maps image_id → (offset, length) of the newest line for
+  that image, so a save is one O(1) append and a read is one seek (last writer
+  wins). Superseded lines are dropped by a background compaction once they
+  outnumber the live records. Single process only.
+
+The CSV/JSON exports are generated from the store when they are needed
+instead of being rewritten on every save.
+"""
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+
+EXPORT_DIR = "learning_app/output/pairs"
+LOG_PATH = os.path.join(EXPORT_DIR, "tagged_results_log.jsonl")
+DB_PATH = os.path.join(EXPORT_DIR, "tagged_results.sqlite3")
+LEGACY_JSON_PATH = os.path.join(EXPORT_DIR, "tagged_results_export.json")
+
+# Columns that always lead the CSV export, in this order
+CSV_COLUMNS = ["image_id", "text", "rejected", "flagged", "tagger", "tags"]
+
+
+class JsonlTagStore:
+    def __init__(self, path=LOG_PATH, compact_min_dead=1000, seed_from=LEGACY_JSON_PATH):
+        """
+        Parameters:
+        - path: the JSONL log
+        - compact_min_dead: compaction starts once there are at least this many
+          superseded lines and they outnumber the live ones
+        - seed_from: legacy JSON export imported once when the log does not exist yet
+        """
+        self.path = path
+        self.compact_min_dead = compact_min_dead
+        self._lock = threading.RLock()
+        self._index = {}
+        self._lines = 0
+        self._compacting = False
+        self._version = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        seed = not os.path.exists(path)
+        self._file = open(path, "a+b")
+        self._load_index()
+        if seed and seed_from and os.path.exists(seed_from):
+            self._seed(seed_from)
+
+    # --- index ---
+    def _load_index(self):
+        """One sequential scan of the log to find the newest line per image_id"""
+        self._file.seek(0)
+        offset = 0
+        for line in self._file:
+            length = len(line)
+            if line.endswith(b"\n"):
+                try:
+                    image_id = json.loads(line).get("image_id")
+                except (json.JSONDecodeError, AttributeError):
+                    image_id = None
+                if image_id is not None:
+                    self._index[image_id] = (offset, length)
+                self._lines += 1
+            else:
+                # Torn final write from a crash: cut it off
+                self._file.truncate(offset)
+            offset += length
+
+    def _seed(self, legacy_path):
+        try:
+            with open(legacy_path, "r") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return
+        records = data if isinstance(data, list) else list(data.values()) if isinstance(data, dict) else []
+        for record in records:
+            if isinstance(record, dict) and record.get("image_id") is not None:
+                self.put(record)
+        print(f"✅ Imported {len(self._index)} records from {legacy_path} into {self.path}")
+
+    # --- writes ---
+    def put(self, record):
+        """Append one record; it replaces any earlier record with the same image_id"""
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            self._index[record["image_id"]] = (offset, len(line))
+            self._lines += 1
+            self._version += 1
+            compact = self._should_compact()
+            if compact:
+                self._compacting = True
+        if compact:
+            threading.Thread(target=self.compact, name="tag-log-compaction", daemon=True).start()
+
+    def put_many(self, records):
+        for record in records:
+            self.put(record)
+
+    def _should_compact(self):
+        dead = self._lines - len(self._index)
+        return not self._compacting and dead >= self.compact_min_dead and dead > len(self._index)
+
+    # --- reads ---
+    def _read_at(self, offset, length):
+        self._file.seek(offset)
+        return json.loads(self._file.read(length))
+
+    def get(self, image_id):
+        with self._lock:
+            location = self._index.get(image_id)
+            return self._read_at(*location) if location else None
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def version(self):
+        """Increases on every write; lets callers cache anything derived from the store"""
+        return self._version
+
+    def iter_records(self):
+        """Every live record, oldest image first"""
+        with self._lock:
+            image_ids = [image_id for image_id, _ in sorted(self._index.items(), key=lambda item: item[1])]
+        for image_id in image_ids:
+            # Look each one up again: compaction may have moved it since the snapshot
+            record = self.get(image_id)
+            if record is not None:
+                yield record
+
+    def records(self):
+        return list(self.iter_records())
+
+    def iter_failures(self):
+        """Live records that were rejected or flagged"""
+        for record in self.iter_records():
+            if record.get("rejected") or record.get("flagged"):
+                yield record
+
+    # --- compaction ---
+    def compact(self):
+        """Rewrite the log with only the newest line per image_id"""
+        try:
+            with self._lock:
+                snapshot = sorted(self._index.items(), key=lambda item: item[1])
+                self._file.seek(0, os.SEEK_END)
+                end = self._file.tell()
+
+            tmp_path = self.path + ".compact"
+            new_index = {}
+            written = 0
+            with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+                for image_id, (offset, length) in snapshot:
+                    src.seek(offset)
+                    new_index[image_id] = (dst.tell(), length)
+                    dst.write(src.read(length))
+                    written += 1
+
+                with self._lock:
+                    # Carry over anything appended while we were copying
+                    src.seek(end)
+                    for line in src:
+                        image_id = json.loads(line).get("image_id")
+                        new_index[image_id] = (dst.tell(), len(line))
+                        dst.write(line)
+                        written += 1
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                    os.replace(tmp_path, self.path)
+                    self._file.close()
+                    self._file = open(self.path, "a+b")
+                    self._index = new_index
+                    # Carried-over lines may supersede copied ones, so count lines, not records
+                    self._lines = written
+            print(f"✅ Compacted {self.path} to {len(new_index)} records")
+        except Exception as e:
+            print(f"⚠️ Tag log compaction failed: {e}")
+        finally:
+            self._compacting = False
+
+
+class SQLiteTagStore:
+    """Same interface as JsonlTagStore, backed by an indexed SQLite table"""
+
+    def __init__(self, path=DB_PATH, seed_from=(LOG_PATH, LEGACY_JSON_PATH)):
+        """
+        Parameters:
+        - path: the SQLite file
+        - seed_from: older local stores imported once when the database is created
+          (the JSONL log first, else the legacy JSON export)
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        seed = not os.path.exists(path)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tags (
+                image_id TEXT PRIMARY KEY,
+                uid TEXT,
+                tagger TEXT,
+                rejected INTEGER NOT NULL DEFAULT 0,
+                flagged INTEGER NOT NULL DEFAULT 0,
+                timestamp TEXT,
+                record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tags_uid ON tags (uid);
+            CREATE INDEX IF NOT EXISTS tags_tagger ON tags (tagger);
+            CREATE INDEX IF NOT EXISTS tags_rejected ON tags (rejected) WHERE rejected = 1;
+            CREATE INDEX IF NOT EXISTS tags_flagged ON tags (flagged) WHERE flagged = 1;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+            """
+        )
+        if seed:
+            self._seed(seed_from)
+
+    def _seed(self, sources):
+        for source in sources:
+            if not source or not os.path.exists(source):
+                continue
+            if source.endswith(".jsonl"):
+                records = JsonlTagStore(source, seed_from=None).records()
+            else:
+                try:
+                    with open(source, "r") as f:
+                        data = json.load(f)
+                except (json.JSONDecodeError, OSError):
+                    continue
+                records = data if isinstance(data, list) else list(data.values()) if isinstance(data, dict) else []
+            records = [r for r in records if isinstance(r, dict) and r.get("image_id") is not None]
+            self.put_many(records)
+            print(f"✅ Imported {len(records)} records from {source} into {self.path}")
+            return
+
+    @staticmethod
+    def _row(record):
+        return (
+            record["image_id"],
+            record.get("uid"),
+            record.get("tagger"),
+            1 if record.get("rejected") else 0,
+            1 if record.get("flagged") else 0,
+            record.get("timestamp"),
+            json.dumps(record),
+        )
+
+    # --- writes ---
+    def put(self, record):
+        """Insert or replace the record for its image_id"""
+        self.put_many([record])
+
+    def put_many(self, records):
+        """Upsert several records in one transaction"""
+        if not records:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    """INSERT INTO tags (image_id, uid, tagger, rejected, flagged, timestamp, record)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (image_id) DO UPDATE SET
+                           uid = excluded.uid, tagger = excluded.tagger,
+                           rejected = excluded.rejected, flagged = excluded.flagged,
+                           timestamp = excluded.timestamp, record = excluded.record""",
+                    [self._row(record) for record in records],
+                )
+                self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def delete_many(self, image_ids):
+        """Remove the records for these image_ids in one transaction"""
+        image_ids = list(image_ids)
+        if not image_ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM tags WHERE image_id = ?", [(i,) for i in image_ids])
+                self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # --- reads ---
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get(self, image_id):
+        rows = self._query("SELECT record FROM tags WHERE image_id = ?", (image_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM tags")[0][0]
+
+    @property
+    def version(self):
+        """Increases on every write from any session or process"""
+        return self._query("SELECT value FROM meta WHERE key = 'version'")[0][0]
+
+    def _iter(self, where="", params=(), batch_size=500):
+        # Keyset pagination keeps memory flat and the lock short
+        last = ""
+        while True:
+            rows = self._query(
+                f"SELECT image_id, record FROM tags WHERE image_id > ? {where} ORDER BY image_id LIMIT ?",
+                (last, *params, batch_size),
+            )
+            for _, record in rows:
+                yield json.loads(record)
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    def iter_records(self):
+        return self._iter()
+
+    def records(self):
+        return list(self.iter_records())
+
+    def iter_failures(self):
+        """Rejected or flagged records, straight from the partial indexes"""
+        return self._iter("AND (rejected = 1 OR flagged = 1)")
+
+    def records_for_user(self, uid):
+        return [json.loads(record) for (record,) in self._query("SELECT record FROM tags WHERE uid = ?", (uid,))]
+
+
+# === Exports ===
+def iter_json_chunks(records):
+    """The same text as json.dumps(list(records), indent=2), one record at a time"""
+    yield "["
+    first = True
+    for record in records:
+        body = json.dumps(record, indent=2).replace("\n", "\n  ")
+        yield ("\n  " if first else ",\n  ") + body
+        first = False
+    yield "]" if first else "\n]"
+
+
+def csv_columns(records):
+    """CSV_COLUMNS followed by every other key, in first-seen order"""
+    columns = list(CSV_COLUMNS)
+    seen = set(columns)
+    for record in records:
+        for key in record:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+
+def iter_csv_chunks(records, columns, rows_per_chunk=500):
+    """CSV text in chunks of rows_per_chunk rows; nested values are JSON-encoded"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for count, record in enumerate(records, 1):
+        writer.writerow({
+            key: json.dumps(value) if isinstance(value, (dict, list)) else value
+            for key, value in record.items()
+        })
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def records_to_json(records):
+    return "".join(iter_json_chunks(records))
+
+
+def records_to_csv(records):
+    """CSV with the standard columns first; nested values are JSON-encoded"""
+    records = list(records)
+    return "".join(iter_csv_chunks(records, csv_columns(records)))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_local_tag_store():
+    """The process-wide local tag store, shared by every Streamlit session"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from learning_app.utils.config import get_local_tag_store_name
+                _store = JsonlTagStore() if get_local_tag_store_name() == "jsonl" else SQLiteTagStore()
+    return _store
@@ -0,0 +1,306 @@
+"""
+Memory-mapped image-pair record files.
+
+convert() normalises one or more JSON pair files to the canonical schema
+(see pair_schema.py) and writes them as two files:
+
+- <name>.<location>-<key>.records.jsonl: one canonical pair per line;
+- <name>.<location>-<key>.records.idx: a binary index, "PAIRIDX1" + item
+  count (uint64), then count + 1 uint64 line offsets, then each pair's id as
+  raw bytes.
+
+The files live in NORMALIZED_DIR. <location> is a hash of the source paths
+and <key> is derived from the schema version and the content hash of every
+source file, so they act as an on-disk cache: ensure_records() only
+normalises again when a source's content (or the schema) changes. Source
+hashes are kept in a manifest with each file's mtime and size, so an
+unchanged file is never re-read just to hash it.
+
+MappedPairs memory-maps both. Opening costs the same however many items the
+file holds: nothing is parsed until an item is requested by index, and the
+ids (needed by the assignment service) come straight from the index without
+decoding any item. The OS pages the file in and out as needed, so resident
+memory stays flat as the corpus grows.
+
+Decoded items are PairRecords: read-only mappings with __slots__, shared by
+every session in the process (a session only holds its own permutation and
+cursor), so one tagger can never change what another one sees.
+
+Usage:
+    python -m learning_app.utils.pair_records convert learning_app/output/pairs/combined_pairs_with_captions.json [more.json ...]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+from learning_app.utils.image_ids import ID_LENGTH
+from learning_app.utils.pair_schema import SCHEMA_VERSION, normalize_items, source_name
+
+NORMALIZED_DIR = "learning_app/output/pairs/normalized"
+MANIFEST_PATH = os.path.join(NORMALIZED_DIR, "manifest.json")
+
+INDEX_MAGIC = b"PAIRIDX1"
+HEADER = struct.Struct("<8sQ")
+ID_BYTES = ID_LENGTH // 2
+
+_manifest_lock = threading.Lock()
+
+
+class PairRecord(Mapping):
+    """Immutable image item; supports item[key] and item.get(key) like the dicts it replaces"""
+
+    __slots__ = ("_keys", "_values")
+
+    # Items from one file share a field layout: keep one interned key tuple per layout
+    _layouts = {}
+
+    def __init__(self, item):
+        keys = tuple(sys.intern(key) for key in item)
+        object.__setattr__(self, "_keys", PairRecord._layouts.setdefault(keys, keys))
+        # Lists (e.g. flags) become tuples so nothing inside a record can change either
+        object.__setattr__(self, "_values", tuple(
+            tuple(value) if isinstance(value, list) else value for value in item.values()
+        ))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PairRecord is read-only")
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __reduce__(self):
+        return PairRecord, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"PairRecord({dict(self)!r})"
+
+    def to_dict(self):
+        return dict(zip(self._keys, self._values))
+
+
+def freeze_items(items):
+    """A tuple of PairRecords for an in-memory list of pairs (e.g. fallback sample data)"""
+    return tuple(item if isinstance(item, PairRecord) else PairRecord(item) for item in items)
+
+
+# === Source fingerprints ===
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest(manifest):
+    tmp_path = f"{MANIFEST_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def source_hash(path, manifest):
+    """SHA-1 of a source file, reused from the manifest while its mtime and size are unchanged"""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    entry = manifest.get(key)
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["sha1"]
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    manifest[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def _as_paths(source_paths):
+    return [source_paths] if isinstance(source_paths, str) else list(source_paths)
+
+
+def record_paths(source_paths, manifest=None):
+    """Cached record and index paths for these sources (in this order) under the current schema"""
+    source_paths = _as_paths(source_paths)
+    manifest = _load_manifest() if manifest is None else manifest
+    key = hashlib.sha1(f"schema:{SCHEMA_VERSION}".encode("utf-8"))
+    for path in source_paths:
+        key.update(f"|{source_name(path)}:{source_hash(path, manifest)}".encode("utf-8"))
+    name = source_name(source_paths[0]) + (f"+{len(source_paths) - 1}" if len(source_paths) > 1 else "")
+    # Sources with the same file name in different folders must not share (or clean up) each other's files
+    location = hashlib.sha1("|".join(os.path.abspath(p) for p in source_paths).encode("utf-8")).hexdigest()[:8]
+    base = os.path.join(NORMALIZED_DIR, f"{name}.{location}-{key.hexdigest()[:16]}")
+    return f"{base}.records.jsonl", f"{base}.records.idx"
+
+
+# === Conversion ===
+def write_records(pairs, records_path, index_path):
+    """Write canonical pairs as a JSONL record file and its index; returns the number written"""
+    offsets = [0]
+    ids = bytearray()
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(records_path + suffix, "wb") as out:
+        for pair in pairs:
+            line = (json.dumps(pair, ensure_ascii=False) + "\n").encode("utf-8")
+            out.write(line)
+            offsets.append(offsets[-1] + len(line))
+            ids += bytes.fromhex(pair["id"])
+
+    count = len(offsets) - 1
+    with open(index_path + suffix, "wb") as out:
+        out.write(HEADER.pack(INDEX_MAGIC, count))
+        out.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        out.write(ids)
+
+    # Records first, so a reader never sees an index pointing past the records
+    os.replace(records_path + suffix, records_path)
+    os.replace(index_path + suffix, index_path)
+    return count
+
+
+def convert(source_paths, records_path, index_path):
+    """
+    Normalise the JSON pair files into one record file (rows deduplicated across files).
+
+    Returns:
+    - (records_path, index_path, number of pairs)
+    """
+    source_paths = _as_paths(source_paths)
+    seen = set()
+    pairs = []
+    for path in source_paths:
+        with open(path, "r") as f:
+            data = json.load(f)
+        stats = {}
+        pairs.extend(normalize_items(data, source_name(path), seen=seen, stats=stats))
+        dropped = ", ".join(f"{count} {reason}" for reason, count in sorted(stats.items()) if reason != "kept")
+        print(f"✅ Normalised {stats['kept']} pairs from {path}" + (f" (dropped {dropped})" if dropped else ""))
+
+    count = write_records(pairs, records_path, index_path)
+    print(f"✅ Wrote {count} canonical pairs to {records_path}")
+    return records_path, index_path, count
+
+
+def ensure_records(source_paths):
+    """Record files for the sources, normalising only when a source's content or the schema changed"""
+    os.makedirs(NORMALIZED_DIR, exist_ok=True)
+    with _manifest_lock:
+        manifest = _load_manifest()
+        records_path, index_path = record_paths(source_paths, manifest)
+        _save_manifest(manifest)
+
+        if not (os.path.exists(records_path) and os.path.exists(index_path)):
+            convert(source_paths, records_path, index_path)
+            # Drop record files of older versions of the same sources
+            prefix = records_path[:-len(".records.jsonl")].rsplit("-", 1)[0]
+            for path in glob.glob(f"{glob.escape(prefix)}-{'[0-9a-f]' * 16}.records.*"):
+                if path not in (records_path, index_path) and not path.endswith(".tmp"):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+    return records_path, index_path
+
+
+class MappedPairs(Sequence):
+    """Read-only, lazily decoded sequence of canonical pairs backed by mmap"""
+
+    def __init__(self, records_path, index_path, transform=None, cache_size=256):
+        """
+        Parameters:
+        - records_path, index_path: files written by write_records()
+        - transform: optional function applied to each decoded dict before it is frozen
+        - cache_size: decoded items kept in memory (most recently used)
+        """
+        self.records_path = records_path
+        self.transform = transform
+        self.cache_size = cache_size
+
+        self._records_file = open(records_path, "rb")
+        self._index_file = open(index_path, "rb")
+        self._records = mmap.mmap(self._records_file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.path.getsize(records_path) else b""
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not a pair record index")
+        self._count = count
+        offsets_start = HEADER.size
+        ids_start = offsets_start + 8 * (count + 1)
+        self._offsets = memoryview(self._index)[offsets_start:ids_start].cast("Q")
+        self._ids = memoryview(self._index)[ids_start:ids_start + ID_BYTES * count]
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._image_ids = None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+
+        with self._lock:
+            item = self._cache.get(index)
+            if item is not None:
+                self._cache.move_to_end(index)
+                return item
+
+        item = json.loads(self._records[self._offsets[index]:self._offsets[index + 1]])
+        if self.transform is not None:
+            item = self.transform(item)
+        item = PairRecord(item)
+        with self._lock:
+            self._cache[index] = item
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return item
+
+    def image_id(self, index):
+        """id of one item, read from the index without decoding the item"""
+        return self._ids[index * ID_BYTES:(index + 1) * ID_BYTES].hex()
+
+    def image_ids(self):
+        """Every id, in order, without decoding any item (built once, then shared)"""
+        if self._image_ids is None:
+            raw = self._ids.tobytes()
+            self._image_ids = tuple(raw[i:i + ID_BYTES].hex() for i in range(0, len(raw), ID_BYTES))
+        return self._image_ids
+
+
+def open_pairs(source_paths, transform=None):
+    """MappedPairs of the canonical pairs of one JSON pair file (or several, combined), normalising if needed"""
+    return MappedPairs(*ensure_records(source_paths), transform=transform)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Canonical image pair record files")
+    parser.add_argument("command", choices=["convert"])
+    parser.add_argument("sources", nargs="+", help="JSON pair files, combined into one record file")
+    args = parser.parse_args()
+
+    pairs = open_pairs(args.sources)
+    print(f"✅ {len(pairs)} canonical pairs in {pairs.records_path}")
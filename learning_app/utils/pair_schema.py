@@ -0,0 +1,158 @@
+"""
+Canonical image-pair schema.
+
+The pair files come from different scrapers and name the same things
+differently (image / image_url / image_src / url, text / caption,
+image_filename / filename). normalize_items() maps every row of any of them
+onto one schema, once, so the UI and other readers never need fallbacks:
+
+- id: content-addressed image_id (see image_ids.image_id_for)
+- url: absolute http(s) image URL, canonicalised
+- caption: caption text, "" when there is none
+- source: name of the pair file the row came from
+- flags: list of markers, currently FLAG_INVALID and FLAG_NO_CAPTION
+
+Rows that cannot show a real image are dropped: no URL, placeholder hosts,
+inline data: URIs (lazy-load placeholders), relative or bare-filename URLs.
+Rows are deduplicated by id, first one wins.
+
+pair_records.py runs this when it builds a record file and caches the result
+on disk.
+"""
+import os
+
+from learning_app.utils.image_ids import PLACEHOLDER_HOSTS, canonical_url, image_id_for
+
+# Bump when normalisation changes, so cached record files are rebuilt
+SCHEMA_VERSION = 1
+
+CANONICAL_FIELDS = ("id", "url", "caption", "source", "flags")
+
+# Source field names, most specific first
+URL_FIELDS = ("image_url", "image", "image_src", "url")
+CAPTION_FIELDS = ("caption", "text")
+FILENAME_FIELDS = ("image_filename", "filename")
+
+# Captions the scrapers wrote when they found none
+PLACEHOLDER_CAPTIONS = {"Image with no caption found.", "No caption available"}
+
+FLAG_INVALID = "invalid"
+FLAG_NO_CAPTION = "no_caption"
+
+
+def source_items(data):
+    """The row dicts of a loaded pair file, whatever its top-level shape"""
+    if isinstance(data, dict):
+        # {filename: url} maps (img_url_fb_red_2_rip/image_urls.json)
+        data = [
+            {"image_filename": key, "image_url": value} if isinstance(value, str) else value
+            for key, value in data.items()
+        ]
+    for item in data:
+        if isinstance(item, str):
+            # Plain URL lists
+            item = {"image_url": item}
+        if isinstance(item, dict):
+            yield item
+
+
+def _first(item, fields):
+    for field in fields:
+        value = item.get(field)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+
+def _drop_reason(url):
+    """Why url cannot be shown, or None if it can"""
+    if not url:
+        return "no_url"
+    if url.startswith("data:"):
+        return "placeholder"
+    if "://" not in url:
+        return "relative_url"
+    if not url.lower().startswith(("http://", "https://")):
+        return "unsupported_url"
+    if any(host in url for host in PLACEHOLDER_HOSTS):
+        return "placeholder"
+    return None
+
+
+def canonical_pair(url, caption, source, flags=(), filename=None):
+    """
+    Build one canonical pair.
+
+    Parameters:
+    - url: absolute image URL
+    - caption: caption text ("" for none)
+    - source: name of the pair file (or other origin) of the row
+    - flags: extra markers; FLAG_NO_CAPTION is added when caption is empty
+    - filename: the image's file name, if known; the id is derived from it first
+    """
+    caption = "" if caption in PLACEHOLDER_CAPTIONS else (caption or "")
+    flags = list(flags)
+    if not caption and FLAG_NO_CAPTION not in flags:
+        flags.append(FLAG_NO_CAPTION)
+    image_id = image_id_for({"image_filename": filename, "image_url": url, "caption": caption})
+    return {"id": image_id, "url": url, "caption": caption, "source": source, "flags": flags}
+
+
+def normalize_item(item, source, stats=None):
+    """
+    The canonical pair for one source row, or None if the row is dropped.
+
+    Parameters:
+    - item: a row of any pair file
+    - source: name of its pair file
+    - stats: optional dict; the drop reason of a dropped row is counted in it
+    """
+    url = _first(item, URL_FIELDS)
+    reason = _drop_reason(url)
+    if reason:
+        if stats is not None:
+            stats[reason] = stats.get(reason, 0) + 1
+        return None
+
+    flags = [FLAG_INVALID] if item.get("valid") is False else []
+    return canonical_pair(
+        canonical_url(url),
+        _first(item, CAPTION_FIELDS),
+        source,
+        flags,
+        filename=_first(item, FILENAME_FIELDS),
+    )
+
+
+def normalize_items(data, source, seen=None, stats=None):
+    """
+    Canonical pairs for a loaded pair file.
+
+    Parameters:
+    - data: the parsed JSON of the file
+    - source: name recorded in each pair's source field
+    - seen: optional set of ids already taken (shared across files to dedupe them together)
+    - stats: optional dict counting kept, duplicate and dropped rows
+
+    Returns:
+    - list of canonical pair dicts, in source order
+    """
+    seen = set() if seen is None else seen
+    stats = {} if stats is None else stats
+    pairs = []
+    for item in source_items(data):
+        pair = normalize_item(item, source, stats)
+        if pair is None:
+            continue
+        if pair["id"] in seen:
+            stats["duplicate"] = stats.get("duplicate", 0) + 1
+            continue
+        seen.add(pair["id"])
+        pairs.append(pair)
+    stats["kept"] = stats.get("kept", 0) + len(pairs)
+    return pairs
+
+
+def source_name(path):
+    """The source value for rows read from path"""
+    return os.path.splitext(os.path.basename(path))[0]
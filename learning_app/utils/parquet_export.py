@@ -0,0 +1,181 @@
+"""
+Parquet export of the local tag store, partitioned by day and tagger.
+
+Each record is flattened into typed columns (one per tag field, booleans for
+the flags, a timestamp, a list column for issues). Element, principle and
+quality values are stored as dictionary-encoded columns over the fixed
+option lists, so they load as pandas categoricals with the same categories in
+every file. Files are laid out Hive-style:
+
+    learning_app/output/parquet/day=2025-04-11/tagger=alice%40example.com/part-0.parquet
+
+A manifest keeps a fingerprint of every partition's rows; later runs only
+write partitions that are new or whose rows changed, and remove partitions
+that no longer have any rows.
+
+Needs pyarrow (installed with streamlit). Usage:
+    python -m learning_app.utils.parquet_export --out learning_app/output/parquet
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from urllib.parse import quote
+
+from learning_app.utils.constants import ELEMENT_OPTIONS, PRINCIPLE_OPTIONS
+from learning_app.utils.local_tag_store import get_local_tag_store
+
+PARQUET_DIR = "learning_app/output/parquet"
+MANIFEST_NAME = "_manifest.json"
+
+# Categorical columns and their known values; anything else is appended per file
+ENUM_COLUMNS = {
+    "primary_element": ELEMENT_OPTIONS,
+    "secondary_element": ELEMENT_OPTIONS,
+    "primary_principle": PRINCIPLE_OPTIONS,
+    "secondary_principle": PRINCIPLE_OPTIONS,
+    "quality": ["High", "Medium", "Low"],
+}
+STRING_COLUMNS = ["image_id", "text", "image_url", "uid", "display_name", "notes"]
+BOOL_COLUMNS = ["irrelevant", "rejected", "flagged"]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def flatten_record(record):
+    """One export row: tag fields lifted to top-level columns, "None" selections as nulls"""
+    tags = record.get("tags") if isinstance(record.get("tags"), dict) else {}
+    timestamp = _parse_timestamp(record.get("timestamp"))
+    row = {column: record.get(column) or tags.get(column) for column in STRING_COLUMNS}
+    for column in ENUM_COLUMNS:
+        value = tags.get(column)
+        row[column] = None if value in (None, "", "None") else str(value)
+    for column in BOOL_COLUMNS:
+        row[column] = bool(record.get(column) or tags.get(column))
+    row["issues"] = [str(issue) for issue in tags.get("issues") or []]
+    row["timestamp"] = timestamp
+    row["day"] = timestamp.date().isoformat() if timestamp else "unknown"
+    row["tagger"] = record.get("tagger") or "unknown"
+    return row
+
+
+def partition_path(day, tagger):
+    return os.path.join(f"day={day}", f"tagger={quote(tagger, safe='')}")
+
+
+def _fingerprint(rows):
+    digest = hashlib.sha1()
+    for row in sorted(rows, key=lambda row: row["image_id"] or ""):
+        digest.update(json.dumps(row, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def rows_to_table(rows):
+    """A pyarrow Table for one partition (without the day/tagger partition columns)"""
+    pa, _ = _require_pyarrow()
+    arrays, fields = [], []
+
+    for column in STRING_COLUMNS:
+        arrays.append(pa.array([row[column] for row in rows], type=pa.string()))
+        fields.append(pa.field(column, pa.string()))
+
+    for column, options in ENUM_COLUMNS.items():
+        values = [row[column] for row in rows]
+        categories = list(options) + sorted({v for v in values if v is not None and v not in options})
+        index = {category: i for i, category in enumerate(categories)}
+        indices = pa.array([index.get(v) for v in values], type=pa.int16())
+        arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(categories, type=pa.string())))
+        fields.append(pa.field(column, pa.dictionary(pa.int16(), pa.string())))
+
+    for column in BOOL_COLUMNS:
+        arrays.append(pa.array([row[column] for row in rows], type=pa.bool_()))
+        fields.append(pa.field(column, pa.bool_()))
+
+    arrays.append(pa.array([row["issues"] for row in rows], type=pa.list_(pa.string())))
+    fields.append(pa.field("issues", pa.list_(pa.string())))
+    arrays.append(pa.array([row["timestamp"] for row in rows], type=pa.timestamp("us")))
+    fields.append(pa.field("timestamp", pa.timestamp("us")))
+
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def export_parquet(store=None, out_dir=PARQUET_DIR):
+    """
+    Write the store as day/tagger-partitioned Parquet, touching only changed partitions.
+
+    Parameters:
+    - store: local tag store (defaults to get_local_tag_store())
+    - out_dir: dataset root
+
+    Returns:
+    - Dict of counts: written, unchanged, removed, rows
+    """
+    _, pq = _require_pyarrow()
+    store = store or get_local_tag_store()
+
+    partitions = {}
+    for record in store.iter_records():
+        row = flatten_record(record)
+        partitions.setdefault(partition_path(row["day"], row["tagger"]), []).append(row)
+
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+
+    stats = {"written": 0, "unchanged": 0, "removed": 0, "rows": 0}
+    new_manifest = {}
+    for relpath, rows in partitions.items():
+        stats["rows"] += len(rows)
+        fingerprint = _fingerprint(rows)
+        new_manifest[relpath] = fingerprint
+        file_path = os.path.join(out_dir, relpath, "part-0.parquet")
+        if manifest.get(relpath) == fingerprint and os.path.exists(file_path):
+            stats["unchanged"] += 1
+            continue
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = file_path + ".tmp"
+        pq.write_table(rows_to_table(rows), tmp_path, compression="zstd")
+        os.replace(tmp_path, file_path)
+        stats["written"] += 1
+
+    # Records can move between partitions (re-tagged on a later day)
+    for relpath in set(manifest) - set(new_manifest):
+        shutil.rmtree(os.path.join(out_dir, relpath), ignore_errors=True)
+        stats["removed"] += 1
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(new_manifest, f, indent=2, sort_keys=True)
+
+    print(
+        f"✅ Parquet export: {stats['written']} partitions written, {stats['unchanged']} unchanged, "
+        f"{stats['removed']} removed ({stats['rows']} rows) in {out_dir}"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export local tags as partitioned Parquet")
+    parser.add_argument("--out", default=PARQUET_DIR)
+    args = parser.parse_args()
+    export_parquet(out_dir=args.out)
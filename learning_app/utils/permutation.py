@@ -0,0 +1,101 @@
+"""
+Per-user deterministic image order.
+
+Every tagger sees the dataset in their own order, derived from a seed that is
+a hash of their uid. The order is a keyed Feistel permutation of [0, n):
+position i of the user's queue maps to a dataset index in O(1), with no
+shuffled copy of the data per session or per rerun. The same uid always
+gets the same order, so a saved cursor (see firebase_service.get_queue_cursor)
+resumes exactly where the user left off, in any session or process.
+
+The Feistel network permutes the smallest power-of-four domain that holds n;
+indexes that land outside [0, n) are walked through the permutation again
+until they land inside (cycle walking), which keeps it a bijection on [0, n).
+"""
+import hashlib
+from collections.abc import Sequence
+
+
+def seed_for_user(uid):
+    """A 64-bit seed derived from the uid"""
+    return int.from_bytes(hashlib.sha256(f"queue-order:{uid}".encode("utf-8")).digest()[:8], "big")
+
+
+class FeistelPermutation:
+    def __init__(self, size, seed, rounds=4):
+        """
+        Parameters:
+        - size: n, the permutation is over range(n)
+        - seed: key; different seeds give unrelated orders
+        - rounds: Feistel rounds (4 is plenty for shuffling, this is not crypto)
+        """
+        self.size = size
+        self.rounds = rounds
+        self._key = seed.to_bytes(8, "big", signed=False)
+        half_bits = 1
+        while (1 << (2 * half_bits)) < max(size, 2):
+            half_bits += 1
+        self._half_bits = half_bits
+        self._half_mask = (1 << half_bits) - 1
+
+    def _round(self, value, round_index):
+        digest = hashlib.blake2b(
+            value.to_bytes(8, "big"), digest_size=8, key=self._key, salt=round_index.to_bytes(16, "big")
+        ).digest()
+        return int.from_bytes(digest, "big") & self._half_mask
+
+    def _encrypt(self, value):
+        left, right = value >> self._half_bits, value & self._half_mask
+        for round_index in range(self.rounds):
+            left, right = right, left ^ self._round(right, round_index)
+        return (left << self._half_bits) | right
+
+    def _decrypt(self, value):
+        left, right = value >> self._half_bits, value & self._half_mask
+        for round_index in reversed(range(self.rounds)):
+            left, right = right ^ self._round(left, round_index), left
+        return (left << self._half_bits) | right
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        """Dataset index shown at queue position index"""
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def position_of(self, dataset_index):
+        """Inverse: the queue position at which dataset_index is shown"""
+        if not 0 <= dataset_index < self.size:
+            raise IndexError(dataset_index)
+        value = self._decrypt(dataset_index)
+        while value >= self.size:
+            value = self._decrypt(value)
+        return value
+
+
+class PermutedSequence(Sequence):
+    """Read-only view of data in permutation order; nothing is copied"""
+
+    def __init__(self, data, permutation):
+        self.data = data
+        self.permutation = permutation
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self.data[self.permutation[index]]
+
+
+def user_order(data, uid):
+    """data in the uid's own stable order"""
+    return PermutedSequence(data, FeistelPermutation(len(data), seed_for_user(uid)))
@@ -0,0 +1,239 @@
+"""
+Parallel, deduplicating bulk uploader for Firebase Storage.
+
+Uploads many local images (page_XXX_img_YY.png, html_img_*.jpg, ...) with a
+thread pool, skips files whose MD5/CRC32C already matches the stored blob, records
+every finished file in a JSONL manifest so an interrupted run resumes where it
+stopped, and writes the filename → public URL map in one pass at the end.
+
+Works with a google-cloud-storage bucket (firebase_admin.storage.bucket()) or
+with LocalDirBucket, a folder-backed stand-in for trying it offline.
+
+Usage:
+    python -m learning_app.utils.storage_uploader path/to/images --concurrency 16
+"""
+import argparse
+import base64
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_PATTERNS = ["page_*_img_*.png", "html_img_*.jpg", "html_*.jpg"]
+DEFAULT_MANIFEST_PATH = "learning_app/output/logs/firebase_upload_manifest.jsonl"
+DEFAULT_LINKS_PATH = "learning_app/output/logs/firebase_image_links.json"
+REMOTE_PREFIX = "images/"
+
+
+def file_md5(path, chunk_size=1024 * 1024):
+    """Base64 MD5 of a local file, the same encoding GCS uses for blob.md5_hash"""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode("ascii")
+
+
+def file_crc32c(path, chunk_size=1024 * 1024):
+    """Base64 CRC32C of a local file (blob.crc32c encoding), or None without google-crc32c"""
+    try:
+        import google_crc32c
+    except ImportError:
+        return None
+    checksum = google_crc32c.Checksum()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode("ascii")
+
+
+def blob_matches(blob, local_path, local_md5):
+    """True if the stored blob has the same content as the local file"""
+    if blob.md5_hash:
+        return blob.md5_hash == local_md5
+    # Composite objects carry no MD5, only a CRC32C
+    remote_crc = getattr(blob, "crc32c", None)
+    return bool(remote_crc) and remote_crc == file_crc32c(local_path)
+
+
+# === Local stand-in for a storage bucket ===
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+        self.md5_hash = file_md5(self.path) if os.path.exists(self.path) else None
+
+    @property
+    def public_url(self):
+        return f"file://{os.path.abspath(self.path)}"
+
+    def upload_from_filename(self, filename, content_type=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        shutil.copyfile(filename, self.path)
+        self.md5_hash = file_md5(self.path)
+        self.bucket.uploads += 1
+
+    def make_public(self):
+        pass
+
+
+class LocalDirBucket:
+    """Minimal folder-backed bucket with the blob API the uploader uses"""
+    def __init__(self, root, name="local-bucket"):
+        self.root = root
+        self.name = name
+        self.uploads = 0
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        blob = LocalBlob(self, name)
+        return blob if blob.md5_hash else None
+
+
+# === Manifest ===
+def load_manifest(path):
+    """{remote_name: {"md5": ..., "url": ...}} for every file a previous run finished"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            done[entry["name"]] = entry
+    return done
+
+
+def collect_files(source_dir, patterns=None):
+    """{filename: local_path} for files in source_dir matching any of the patterns"""
+    patterns = patterns or DEFAULT_PATTERNS
+    files = {}
+    for entry in os.scandir(source_dir):
+        if entry.is_file() and any(fnmatch.fnmatch(entry.name, pattern) for pattern in patterns):
+            files[entry.name] = entry.path
+    return files
+
+
+def upload_image(bucket, local_path, remote_filename, make_public=True, local_md5=None):
+    """
+    Upload one file unless a blob with the same MD5 (or CRC32C) already exists.
+
+    Returns:
+    - (url, md5, uploaded) where uploaded is False when the upload was skipped
+    """
+    blob_name = f"{REMOTE_PREFIX}{remote_filename}"
+    local_md5 = local_md5 or file_md5(local_path)
+
+    existing = bucket.get_blob(blob_name)
+    if existing is not None and blob_matches(existing, local_path, local_md5):
+        return existing.public_url, local_md5, False
+
+    blob = bucket.blob(blob_name)
+    blob.upload_from_filename(local_path)
+    if make_public:
+        blob.make_public()
+    return blob.public_url, local_md5, True
+
+
+def bulk_upload(files, bucket, concurrency=8, manifest_path=DEFAULT_MANIFEST_PATH,
+                links_path=DEFAULT_LINKS_PATH, make_public=True):
+    """
+    Upload {filename: local_path} to the bucket in parallel.
+
+    Parameters:
+    - files: {remote filename: local path}
+    - bucket: storage bucket (or LocalDirBucket)
+    - concurrency: number of upload threads
+    - manifest_path: JSONL log of finished files, used to resume
+    - links_path: filename → URL JSON map, merged and rewritten once at the end
+
+    Returns:
+    - Dict of counts: uploaded, skipped_manifest, skipped_remote, failed, seconds
+    """
+    started = time.monotonic()
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    done = load_manifest(manifest_path)
+    stats = {"uploaded": 0, "skipped_manifest": 0, "skipped_remote": 0, "failed": 0}
+    urls = {}
+    lock = threading.Lock()
+
+    def upload(name, local_path):
+        local_md5 = file_md5(local_path)
+        previous = done.get(name)
+        if previous and previous.get("md5") == local_md5:
+            # Finished by an earlier run and unchanged since: no network call at all
+            return name, previous["url"], local_md5, None
+        url, md5, uploaded = upload_image(bucket, local_path, name, make_public, local_md5)
+        return name, url, md5, uploaded
+
+    with open(manifest_path, "a") as manifest, ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(upload, name, path): name for name, path in files.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                name, url, md5, uploaded = future.result()
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"❌ Failed to upload {name}: {e}")
+                continue
+
+            urls[name] = url
+            if uploaded is None:
+                stats["skipped_manifest"] += 1
+                continue
+            stats["uploaded" if uploaded else "skipped_remote"] += 1
+            with lock:
+                manifest.write(json.dumps({"name": name, "md5": md5, "url": url}) + "\n")
+                manifest.flush()
+
+    # One read-merge-write of the URL map instead of one per file
+    links = {}
+    if links_path and os.path.exists(links_path):
+        with open(links_path, "r") as f:
+            links = json.load(f)
+    links.update(urls)
+    if links_path:
+        with open(links_path, "w") as f:
+            json.dump(links, f, indent=2)
+
+    stats["seconds"] = round(time.monotonic() - started, 2)
+    print(
+        f"✅ Bulk upload: {stats['uploaded']} uploaded, {stats['skipped_remote']} already in bucket, "
+        f"{stats['skipped_manifest']} already in manifest, {stats['failed']} failed in {stats['seconds']}s"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk upload images to Firebase Storage")
+    parser.add_argument("source_dir", help="Folder containing the images")
+    parser.add_argument("--pattern", action="append", help="Filename glob (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--links", default=DEFAULT_LINKS_PATH)
+    parser.add_argument("--local-bucket", help="Upload into this folder instead of Firebase (dry runs)")
+    args = parser.parse_args()
+
+    if args.local_bucket:
+        target = LocalDirBucket(args.local_bucket)
+    else:
+        from learning_app.utils.firebase_client import get_storage_bucket
+        target = get_storage_bucket()
+
+    bulk_upload(
+        collect_files(args.source_dir, args.pattern),
+        target,
+        concurrency=args.concurrency,
+        manifest_path=args.manifest,
+        links_path=args.links,
+    )
@@ -0,0 +1,423 @@
+"""
+Storage backends for firebase_service.
+
+Every database call in firebase_service goes through one of these, so the
+tagging path can run against the real Realtime Database, a plain in-memory
+tree (tests, load generation) or a local SQLite file (offline scale runs)
+without changing any caller. Paths use RTDB syntax ("tags/img_1/uid_9").
+
+Pick one with TAG_BACKEND=rtdb|memory|sqlite (see config.get_tag_backend_name).
+"""
+import json
+import sqlite3
+import threading
+
+
+def split_path(path):
+    return [segment for segment in (path or "").split("/") if segment]
+
+
+def rtdb_key_order(key):
+    """Sort key matching RTDB's order_by_key: 32-bit integer keys first, numerically"""
+    if key.lstrip("-").isdigit() and -2**31 <= int(key) < 2**31:
+        return (0, int(key), "")
+    return (1, 0, key)
+
+
+def server_increment(delta):
+    """RTDB server value for update(): adds delta to the number at the path (0 if missing)"""
+    return {".sv": {"increment": delta}}
+
+
+def resolve_server_value(value, read_current):
+    """The value RTDB stores for value; read_current() is only called for a server_increment()"""
+    if not (isinstance(value, dict) and isinstance(value.get(".sv"), dict) and "increment" in value[".sv"]):
+        return value
+    current = read_current()
+    if not isinstance(current, (int, float)) or isinstance(current, bool):
+        current = 0
+    return current + value[".sv"]["increment"]
+
+
+class BackendEvent:
+    """Same shape as firebase_admin.db.Event: event_type, path, data"""
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class TagBackend:
+    """Operations firebase_service needs from a database"""
+    name = "base"
+    supports_listen = False
+
+    def get(self, path, shallow=False):
+        """Value at path (None if missing); shallow returns {child_key: True}"""
+        raise NotImplementedError
+
+    def set(self, path, value):
+        """Replace the value at path (None deletes it)"""
+        raise NotImplementedError
+
+    def update(self, updates):
+        """Atomically apply a {path: value} multi-path update at the root; values may be server_increment()s"""
+        raise NotImplementedError
+
+    def transaction(self, path, fn):
+        """Atomically replace the value at path with fn(current) and return the new value"""
+        raise NotImplementedError
+
+    def list_keys(self, path):
+        """Child keys of path, in the order page_by_key() walks them"""
+        raise NotImplementedError
+
+    def page_by_key(self, path, start_key, limit=None, end_key=None):
+        """(key, value) children of path from start_key up to end_key (both inclusive), at most `limit` of them"""
+        raise NotImplementedError
+
+    def query_by_child(self, path, child, value):
+        """{key: node} for children of path whose `child` field equals value"""
+        node = self.get(path) or {}
+        return {key: item for key, item in node.items() if isinstance(item, dict) and item.get(child) == value}
+
+    def listen(self, path, callback):
+        """Stream put/patch events for path to callback; returns an object with close()"""
+        raise NotImplementedError(f"{self.name} backend does not support listen()")
+
+
+# === Firebase Realtime Database ===
+class RTDBBackend(TagBackend):
+    name = "rtdb"
+    supports_listen = True
+
+    def __init__(self, app=None):
+        from firebase_admin import db
+        self._db = db
+        self._app = app
+
+    def _ref(self, path=None):
+        return self._db.reference(path or "/", app=self._app)
+
+    def get(self, path, shallow=False):
+        return self._ref(path).get(shallow=shallow)
+
+    def set(self, path, value):
+        if value is None:
+            self._ref(path).delete()
+        else:
+            self._ref(path).set(value)
+
+    def update(self, updates):
+        if updates:
+            self._ref().update(updates)
+
+    def transaction(self, path, fn):
+        return self._ref(path).transaction(fn)
+
+    def list_keys(self, path):
+        return sorted(self.get(path, shallow=True) or {}, key=rtdb_key_order)
+
+    def page_by_key(self, path, start_key, limit=None, end_key=None):
+        query = self._ref(path).order_by_key().start_at(start_key)
+        if end_key is not None:
+            query = query.end_at(end_key)
+        if limit is not None:
+            query = query.limit_to_first(limit)
+        page = query.get() or {}
+        return sorted(page.items(), key=lambda item: rtdb_key_order(item[0]))
+
+    def query_by_child(self, path, child, value):
+        return self._ref(path).order_by_child(child).equal_to(value).get() or {}
+
+    def listen(self, path, callback):
+        return self._ref(path).listen(callback)
+
+
+# === In-memory tree ===
+class _Registration:
+    def __init__(self, backend, entry):
+        self._backend = backend
+        self._entry = entry
+
+    def close(self):
+        with self._backend._lock:
+            if self._entry in self._backend._listeners:
+                self._backend._listeners.remove(self._entry)
+
+
+class MemoryBackend(TagBackend):
+    """A nested dict behind a lock. listen() delivers events synchronously after each write."""
+    name = "memory"
+    supports_listen = True
+
+    def __init__(self):
+        self._root = {}
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def _node(self, segments):
+        node = self._root
+        for segment in segments:
+            if not isinstance(node, dict) or segment not in node:
+                return None
+            node = node[segment]
+        return node
+
+    def _write(self, segments, value):
+        if isinstance(value, dict) and not value:
+            value = None
+        if not segments:
+            self._root = _copy(value) if isinstance(value, dict) else {}
+            return
+        # Walk down, remembering parents so empty ones can be pruned after a delete
+        parents = []
+        node = self._root
+        for segment in segments[:-1]:
+            child = node.get(segment)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[segment] = {}
+            parents.append((node, segment))
+            node = child
+        if value is None:
+            node.pop(segments[-1], None)
+            while parents and not node:
+                parent, key = parents.pop()
+                del parent[key]
+                node = parent
+        else:
+            node[segments[-1]] = _copy(value)
+
+    def get(self, path, shallow=False):
+        with self._lock:
+            node = self._node(split_path(path))
+            if shallow and isinstance(node, dict):
+                return {key: True for key in node}
+            return _copy(node)
+
+    def set(self, path, value):
+        with self._lock:
+            self._write(split_path(path), value)
+            self._notify({path: value})
+
+    def update(self, updates):
+        with self._lock:
+            resolved = {}
+            for path, value in updates.items():
+                segments = split_path(path)
+                resolved[path] = resolve_server_value(value, lambda: self._node(segments))
+                self._write(segments, resolved[path])
+            self._notify(resolved)
+
+    def transaction(self, path, fn):
+        with self._lock:
+            segments = split_path(path)
+            new_value = fn(_copy(self._node(segments)))
+            self._write(segments, new_value)
+            self._notify({path: new_value})
+            return _copy(new_value)
+
+    def list_keys(self, path):
+        node = self.get(path, shallow=True) or {}
+        return sorted(node, key=rtdb_key_order)
+
+    def page_by_key(self, path, start_key, limit=None, end_key=None):
+        with self._lock:
+            node = self._node(split_path(path)) or {}
+            keys = [
+                key for key in sorted(node, key=rtdb_key_order)
+                if rtdb_key_order(key) >= rtdb_key_order(start_key)
+                and (end_key is None or rtdb_key_order(key) <= rtdb_key_order(end_key))
+            ]
+            return [(key, _copy(node[key])) for key in keys[:limit]]
+
+    def listen(self, path, callback):
+        entry = (split_path(path), callback)
+        with self._lock:
+            self._listeners.append(entry)
+            # RTDB streams always open with a snapshot of the whole path
+            callback(BackendEvent("put", "/", self.get(path)))
+        return _Registration(self, entry)
+
+    def _notify(self, updates):
+        for listen_segments, callback in list(self._listeners):
+            depth = len(listen_segments)
+            for path, value in updates.items():
+                segments = split_path(path)
+                if segments[:depth] == listen_segments:
+                    callback(BackendEvent("put", "/" + "/".join(segments[depth:]), _copy(value)))
+                elif listen_segments[:len(segments)] == segments:
+                    # A write above the listened path replaces it
+                    callback(BackendEvent("put", "/", self.get("/".join(listen_segments))))
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {key: _copy(child) for key, child in value.items()}
+    if isinstance(value, list):
+        return [_copy(child) for child in value]
+    return value
+
+
+# === SQLite file ===
+class SQLiteBackend(TagBackend):
+    """
+    The tree stored as one row per leaf value, plus a parent→child key table
+    so shallow reads and paging are index lookups instead of subtree scans.
+    """
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS leaves (path TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS children (parent TEXT NOT NULL, key TEXT NOT NULL, "
+            "PRIMARY KEY (parent, key)) WITHOUT ROWID"
+        )
+        self._lock = threading.RLock()
+
+    # --- helpers (caller holds the lock) ---
+    def _subtree_rows(self, prefix):
+        if not prefix:
+            return self._conn.execute("SELECT path, value FROM leaves").fetchall()
+        # Everything under "prefix/" sorts between "prefix/" and "prefix0" ("0" follows "/")
+        return self._conn.execute(
+            "SELECT path, value FROM leaves WHERE path = ? OR (path >= ? AND path < ?)",
+            (prefix, prefix + "/", prefix + "0"),
+        ).fetchall()
+
+    def _read(self, segments):
+        prefix = "/".join(segments)
+        rows = self._subtree_rows(prefix)
+        if not rows:
+            return None
+        depth = len(segments)
+        tree = {}
+        for path, value in rows:
+            row_segments = split_path(path)[depth:]
+            if not row_segments:
+                return json.loads(value)
+            node = tree
+            for segment in row_segments[:-1]:
+                node = node.setdefault(segment, {})
+            node[row_segments[-1]] = json.loads(value)
+        return tree
+
+    def _delete(self, segments):
+        prefix = "/".join(segments)
+        if not prefix:
+            self._conn.execute("DELETE FROM leaves")
+            self._conn.execute("DELETE FROM children")
+            return
+        self._conn.execute(
+            "DELETE FROM leaves WHERE path = ? OR (path >= ? AND path < ?)",
+            (prefix, prefix + "/", prefix + "0"),
+        )
+        self._conn.execute(
+            "DELETE FROM children WHERE parent = ? OR (parent >= ? AND parent < ?)",
+            (prefix, prefix + "/", prefix + "0"),
+        )
+        # Unlink from the parent and prune ancestors left without children
+        while segments:
+            parent = "/".join(segments[:-1])
+            self._conn.execute("DELETE FROM children WHERE parent = ? AND key = ?", (parent, segments[-1]))
+            if not parent or self._conn.execute("SELECT 1 FROM children WHERE parent = ? LIMIT 1", (parent,)).fetchone():
+                break
+            segments = segments[:-1]
+
+    def _write(self, segments, value):
+        self._delete(segments)
+        if value is None or (isinstance(value, dict) and not value):
+            return
+        # A leaf written inside what used to be a leaf ancestor replaces it
+        for i in range(1, len(segments)):
+            self._conn.execute("DELETE FROM leaves WHERE path = ?", ("/".join(segments[:i]),))
+        for i in range(len(segments)):
+            self._conn.execute(
+                "INSERT OR IGNORE INTO children (parent, key) VALUES (?, ?)",
+                ("/".join(segments[:i]), segments[i]),
+            )
+        self._write_tree(segments, value)
+
+    def _write_tree(self, segments, value):
+        path = "/".join(segments)
+        if isinstance(value, dict):
+            for key, child in value.items():
+                if child is None or (isinstance(child, dict) and not child):
+                    continue
+                self._conn.execute("INSERT OR IGNORE INTO children (parent, key) VALUES (?, ?)", (path, key))
+                self._write_tree(segments + [key], child)
+        else:
+            self._conn.execute("INSERT OR REPLACE INTO leaves (path, value) VALUES (?, ?)", (path, json.dumps(value)))
+
+    def _atomic(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    # --- TagBackend ---
+    def get(self, path, shallow=False):
+        with self._lock:
+            segments = split_path(path)
+            if shallow:
+                keys = self._conn.execute("SELECT key FROM children WHERE parent = ?", ("/".join(segments),)).fetchall()
+                if keys:
+                    return {key: True for (key,) in keys}
+            return self._read(segments)
+
+    def set(self, path, value):
+        self._atomic(lambda: self._write(split_path(path), value))
+
+    def update(self, updates):
+        def apply():
+            for path, value in updates.items():
+                segments = split_path(path)
+                self._write(segments, resolve_server_value(value, lambda: self._read(segments)))
+        self._atomic(apply)
+
+    def transaction(self, path, fn):
+        segments = split_path(path)
+
+        def apply():
+            new_value = fn(self._read(segments))
+            self._write(segments, new_value)
+            return new_value
+        return self._atomic(apply)
+
+    def list_keys(self, path):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM children WHERE parent = ? ORDER BY key", ("/".join(split_path(path)),)
+            ).fetchall()
+        return [key for (key,) in rows]
+
+    def page_by_key(self, path, start_key, limit=None, end_key=None):
+        segments = split_path(path)
+        with self._lock:
+            keys = self._conn.execute(
+                "SELECT key FROM children WHERE parent = ? AND key >= ? AND (? IS NULL OR key <= ?) ORDER BY key LIMIT ?",
+                ("/".join(segments), start_key, end_key, end_key, -1 if limit is None else limit),
+            ).fetchall()
+            return [(key, self._read(segments + [key])) for (key,) in keys]
+
+
+def create_backend(name, sqlite_path=None, app=None):
+    """Build the backend selected in config"""
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SQLiteBackend(sqlite_path)
+    if name == "rtdb":
+        return RTDBBackend(app)
+    raise ValueError(f"Unknown tag backend: {name}")
@@ -0,0 +1,238 @@
+"""
+Live in-process mirror of /tags.
+
+One mirror per process keeps every tag in memory, indexed both by image and
+by user, so lookups and counts are dictionary reads instead of network calls.
+It is kept current by a single RTDB listen() stream shared by every
+Streamlit session in the process; the stream opens with a snapshot of the
+whole tree, which is what seeds the mirror (no separate bootstrap read, so
+/tags is downloaded once per start).
+
+If the stream ends (its listener thread dies, a callback fails, or the
+server sends cancel / auth_revoked) the mirror stops reporting itself fresh,
+so reads fall back to the backend, and it re-subscribes in the background.
+"""
+import threading
+import time
+
+
+class TagMirror:
+    def __init__(self, listen, max_staleness=None):
+        """
+        Parameters:
+        - listen: callable taking an event callback and returning a registration
+          with close(), e.g. db.reference("tags").listen
+        - max_staleness: seconds without any event after which reads are
+          treated as stale (None = fresh as long as the stream is open)
+        """
+        self._listen = listen
+        self.max_staleness = max_staleness
+
+        self._by_image = {}
+        self._by_user = {}
+        self._lock = threading.RLock()
+
+        self._registration = None
+        self._starting = False
+        self._closed = False
+        self._bootstrapped = False
+        self._streaming = False
+        self._subscribed_at = None
+        self._last_update = None
+        self._error = None
+        self._events_applied = 0
+
+    # --- lifecycle ---
+    def start(self):
+        """Subscribe in a background thread; reads fall back to the network until the snapshot arrives"""
+        with self._lock:
+            if self._starting or self._closed:
+                return
+            self._starting = True
+        threading.Thread(target=self._start, name="tag-mirror", daemon=True).start()
+
+    def _start(self):
+        try:
+            with self._lock:
+                # Not fresh again until the new stream's opening snapshot has replaced the indexes
+                self._bootstrapped = False
+                self._streaming = True
+                self._error = None
+                self._subscribed_at = time.monotonic()
+            self._registration = self._listen(self._on_event)
+        except Exception as e:
+            self._streaming = False
+            self._error = e
+            print(f"❌ Tag mirror failed to start: {e}")
+        finally:
+            self._starting = False
+
+    def close(self):
+        self._closed = True
+        self._stop_stream()
+
+    def _stop_stream(self):
+        self._streaming = False
+        registration, self._registration = self._registration, None
+        if registration is not None:
+            try:
+                registration.close()
+            except Exception as e:
+                print(f"⚠️ Tag mirror could not close its stream: {e}")
+
+    def _stream_ended(self, reason):
+        """The listen() stream is gone: stop serving reads and re-subscribe in the background"""
+        with self._lock:
+            if not self._streaming:
+                return
+            self._streaming = False
+            self._error = reason
+        print(f"⚠️ Tag mirror stream ended ({reason}); reading from the backend until it restarts")
+        # Not on this thread: it may be the listener itself, which close() would try to join
+        threading.Thread(target=self._restart, name="tag-mirror-restart", daemon=True).start()
+
+    def _restart(self):
+        self._stop_stream()
+        self.start()
+
+    def _stream_alive(self):
+        """False once the listener thread behind the registration (firebase_admin's) has exited"""
+        thread = getattr(self._registration, "_thread", None)
+        return thread is None or thread.is_alive()
+
+    # --- freshness ---
+    def is_fresh(self):
+        """True when reads from the mirror can be trusted"""
+        if self._streaming and not self._stream_alive():
+            self._stream_ended("listener thread exited")
+        if not (self._bootstrapped and self._streaming):
+            return False
+        if self.max_staleness is not None:
+            return self.staleness() <= self.max_staleness
+        return True
+
+    def staleness(self):
+        """Seconds since the mirror last changed (infinity before bootstrap)"""
+        if self._last_update is None:
+            return float("inf")
+        return time.monotonic() - self._last_update
+
+    def status(self):
+        return {
+            "bootstrapped": self._bootstrapped,
+            "streaming": self._streaming,
+            "staleness_seconds": self.staleness(),
+            "events_applied": self._events_applied,
+            "images": len(self._by_image),
+            "users": len(self._by_user),
+            "error": str(self._error) if self._error else None,
+        }
+
+    # --- reads ---
+    def get_image_tags(self, image_id):
+        with self._lock:
+            return dict(self._by_image.get(image_id, {}))
+
+    def get_user_tags(self, uid):
+        with self._lock:
+            return dict(self._by_user.get(uid, {}))
+
+    def count_image_tags(self, image_id):
+        return len(self._by_image.get(image_id, ()))
+
+    def count_user_tags(self, uid):
+        return len(self._by_user.get(uid, ()))
+
+    def count_tagged_images(self):
+        return len(self._by_image)
+
+    def count_all_image_tags(self):
+        """{image_id: number of users who tagged it}"""
+        with self._lock:
+            return {image_id: len(tags) for image_id, tags in self._by_image.items()}
+
+    # --- writes ---
+    def apply_local(self, image_id, uid, changed):
+        """
+        Apply a {field path: value} patch this process just saved to one tag, so
+        its own reads see it before the stream echoes it back. Applied field by
+        field, like the database does, so fields it does not carry (created_at)
+        are kept.
+        """
+        with self._lock:
+            for path, value in changed.items():
+                self._put([image_id, uid] + [s for s in path.split("/") if s], value)
+
+    def _on_event(self, event):
+        """Apply one RTDB put/patch event to both indexes"""
+        if event.event_type not in ("put", "patch"):
+            # cancel / auth_revoked: the server has stopped sending us changes
+            self._stream_ended(f"{event.event_type} event")
+            return
+        segments = [s for s in (event.path or "/").split("/") if s]
+        data = event.data
+        try:
+            with self._lock:
+                if event.event_type == "put":
+                    self._put(segments, data)
+                else:
+                    for key, value in (data or {}).items():
+                        self._put(segments + [s for s in key.split("/") if s], value)
+                self._events_applied += 1
+                self._last_update = time.monotonic()
+        except Exception as e:
+            # Raising here would kill the listener thread; the indexes may now be off, so rebuild them
+            self._stream_ended(f"event could not be applied: {e}")
+
+    def _put(self, segments, value):
+        if not segments:
+            # Whole-tree snapshot (the stream always starts with one)
+            self._by_image = {}
+            self._by_user = {}
+            for image_id, tag_entries in (value or {}).items():
+                self._set_image(image_id, tag_entries)
+            if not self._bootstrapped:
+                self._bootstrapped = True
+                print(f"✅ Tag mirror loaded {len(self._by_image)} images in {time.monotonic() - self._subscribed_at:.1f}s")
+        elif len(segments) == 1:
+            self._set_image(segments[0], value)
+        elif len(segments) == 2:
+            self._set_tag(segments[0], segments[1], value)
+        else:
+            # A field inside one tag
+            image_id, uid, *field_path = segments
+            existing = self._by_image.get(image_id, {}).get(uid)
+            tag = dict(existing) if isinstance(existing, dict) else {}
+            node = tag
+            for key in field_path[:-1]:
+                child = node.get(key)
+                node[key] = dict(child) if isinstance(child, dict) else {}
+                node = node[key]
+            if value is None:
+                node.pop(field_path[-1], None)
+            else:
+                node[field_path[-1]] = value
+            self._set_tag(image_id, uid, tag or None)
+
+    def _set_image(self, image_id, tag_entries):
+        for uid in list(self._by_image.get(image_id, {})):
+            self._set_tag(image_id, uid, None)
+        if isinstance(tag_entries, dict):
+            for uid, tag in tag_entries.items():
+                self._set_tag(image_id, uid, tag)
+
+    def _set_tag(self, image_id, uid, tag):
+        if tag is None:
+            image_tags = self._by_image.get(image_id)
+            if image_tags is not None:
+                image_tags.pop(uid, None)
+                if not image_tags:
+                    del self._by_image[image_id]
+            user_tags = self._by_user.get(uid)
+            if user_tags is not None:
+                user_tags.pop(image_id, None)
+                if not user_tags:
+                    del self._by_user[uid]
+            return
+        self._by_image.setdefault(image_id, {})[uid] = tag
+        self._by_user.setdefault(uid, {})[image_id] = tag
@@ -0,0 +1,290 @@
+"""
+Durable local outbox for Firebase tag writes.
+
+Every tag save is upserted into a small SQLite table keyed by (image_id, uid)
+(or folded into the row already queued for that key, see merge_fn) and the
+caller returns straight away. A replay thread drains the table to
+Firebase every interval_ms, or as soon as batch_size rows are waiting, in
+batches of up to batch_size, backing off exponentially while Firebase is slow
+or unreachable. The table is bounded by max_pending: once it is full, saves
+of new keys wait for the replay to catch up (re-saves of a queued key only
+replace its row and never wait). Rows only leave the outbox once the write has succeeded, so a
+crash or a brownout never loses a tag; it just replays later.
+
+Several processes may share one outbox file. A replayer first claims its
+batch in a BEGIN IMMEDIATE transaction (claimed_by plus a lease expiry), so
+a row is only ever in flight in one process; a claim left behind by a process
+that died is taken over once its lease has expired.
+"""
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class TagOutbox:
+    def __init__(self, path, write_fn, batch_size=500, interval_ms=500,
+                 min_backoff=1.0, max_backoff=60.0, lease_seconds=120.0, max_pending=10000,
+                 merge_fn=None, name="tag-outbox"):
+        """
+        Parameters:
+        - path: SQLite file holding the outbox
+        - write_fn: called with a {(image_id, uid): entry} dict; raising triggers backoff
+        - batch_size: most rows replayed per write_fn call
+        - interval_ms: how long rows may wait for a batch to fill before they are replayed
+        - min_backoff, max_backoff: bounds in seconds for retry delays after failures
+        - lease_seconds: how long a claimed batch stays reserved for this process;
+          must outlast one write_fn call
+        - max_pending: rows at which append() of a new key blocks until replay frees room
+        - merge_fn: (queued entry, new entry) → entry stored for a key that is still
+          queued; None keeps only the new entry
+        """
+        self.path = path
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.lease_seconds = lease_seconds
+        self.max_pending = max_pending
+        self.merge_fn = merge_fn
+        self.name = name
+        # Identifies this outbox's claims among every process sharing the file
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                image_id TEXT NOT NULL,
+                uid TEXT NOT NULL,
+                entry TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                claimed_by TEXT,
+                claim_expires REAL,
+                PRIMARY KEY (image_id, uid)
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "claimed_by" not in columns:
+            # Outbox files written before rows were claimed
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN claimed_by TEXT")
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN claim_expires REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_seq ON outbox (seq)")
+
+        self._lock = threading.Lock()
+        # Serialises replay batches so two drains never reorder writes to a key
+        self._replay_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._seq = time.time_ns()
+        self._backoff = 0.0
+
+        self._stats = {
+            "appended": 0,
+            "coalesced": 0,
+            "replayed": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "blocked": 0,
+            "rejected": 0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def append(self, image_id, uid, entry, timeout=10):
+        """
+        Durably record the latest entry for (image_id, uid), folded into a
+        still-queued one with merge_fn if set.
+
+        Returns immediately unless the outbox holds max_pending rows and this is
+        a new key; then it waits up to timeout seconds for the replay to catch up.
+
+        Returns:
+        - True once the entry is stored, False if the outbox stayed full
+        """
+        deadline = time.monotonic() + timeout
+        blocked = False
+        while True:
+            with self._lock:
+                # One write transaction, so another process sharing the file cannot
+                # change the row between our read and our upsert
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    queued = self._conn.execute(
+                        "SELECT entry FROM outbox WHERE image_id = ? AND uid = ?", (image_id, uid)
+                    ).fetchone()
+                    pending = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+                    # Only a new key grows the table; a re-save just replaces its row
+                    stored = queued is not None or pending < self.max_pending
+                    if stored:
+                        if queued is not None and self.merge_fn is not None:
+                            entry = self.merge_fn(json.loads(queued[0]), entry)
+                        self._seq = max(self._seq + 1, time.time_ns())
+                        # A claim on the row is kept: the new entry waits until that replay is done
+                        self._conn.execute(
+                            """INSERT INTO outbox (image_id, uid, entry, seq) VALUES (?, ?, ?, ?)
+                               ON CONFLICT (image_id, uid) DO UPDATE SET entry = excluded.entry, seq = excluded.seq""",
+                            (image_id, uid, json.dumps(entry), self._seq),
+                        )
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                if stored:
+                    if queued is not None:
+                        self._stats["coalesced"] += 1
+                    else:
+                        pending += 1
+                    self._stats["appended"] += 1
+                    break
+                if not blocked:
+                    blocked = True
+                    self._stats["blocked"] += 1
+                if time.monotonic() >= deadline:
+                    self._stats["rejected"] += 1
+                    return False
+            if self._backoff == 0:
+                self._wake.set()
+            time.sleep(min(self.interval, max(0.0, deadline - time.monotonic())))
+
+        # A full batch goes out now; anything smaller waits for the interval to fill it
+        if pending >= self.batch_size and self._backoff == 0:
+            self._wake.set()
+        return True
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def pending_image_ids(self, uid):
+        """image_ids with a tag by uid still waiting to be replayed"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT image_id FROM outbox WHERE uid = ?", (uid,))]
+
+    def replay_batch(self):
+        """
+        Claim the oldest batch_size unclaimed rows and send them to write_fn.
+
+        Returns:
+        - Number of rows replayed (0 when nothing is left to claim); raises if write_fn fails
+        """
+        with self._replay_lock:
+            rows = self._claim()
+            if not rows:
+                return 0
+
+            batch = {(image_id, uid): json.loads(entry) for image_id, uid, entry, _ in rows}
+            try:
+                self.write_fn(batch)
+            except Exception:
+                with self._lock:
+                    self._release(rows)
+                    self._stats["failed_batches"] += 1
+                raise
+
+            with self._lock:
+                # Only remove rows that were not overwritten while we were writing;
+                # overwritten ones are released so their new entry replays next
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "DELETE FROM outbox WHERE image_id = ? AND uid = ? AND seq = ?",
+                    [(image_id, uid, seq) for image_id, uid, _, seq in rows],
+                )
+                self._release(rows, begin=False)
+                self._stats["batches"] += 1
+                self._stats["replayed"] += len(rows)
+            return len(rows)
+
+    def _claim(self):
+        """Reserve the oldest rows nobody else holds a live claim on; returns them"""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes cannot
+            # both read the same rows as unclaimed
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    """SELECT image_id, uid, entry, seq FROM outbox
+                       WHERE claimed_by IS NULL OR claim_expires < ?
+                       ORDER BY seq LIMIT ?""",
+                    (now, self.batch_size),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET claimed_by = ?, claim_expires = ? WHERE image_id = ? AND uid = ?",
+                    [(self.owner, now + self.lease_seconds, image_id, uid) for image_id, uid, _, _ in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _release(self, rows, begin=True):
+        """Drop this process's claim on rows still in the outbox. Call with _lock held."""
+        if begin:
+            self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.executemany(
+            "UPDATE outbox SET claimed_by = NULL, claim_expires = NULL WHERE image_id = ? AND uid = ? AND claimed_by = ?",
+            [(image_id, uid, self.owner) for image_id, uid, _, _ in rows],
+        )
+        self._conn.execute("COMMIT")
+
+    def flush(self, timeout=10):
+        """
+        Try to drain the outbox now (on logout and at exit).
+
+        Returns:
+        - Number of rows replayed; anything left stays queued for later
+        """
+        deadline = time.monotonic() + timeout
+        replayed = 0
+        while time.monotonic() < deadline:
+            try:
+                sent = self.replay_batch()
+            except Exception as e:
+                print(f"⚠️ {self.name}: flush stopped, rows stay queued: {e}")
+                break
+            if not sent:
+                break
+            replayed += sent
+        return replayed
+
+    def close(self, timeout=10):
+        self._closed = True
+        self._wake.set()
+        deadline = time.monotonic() + timeout
+        self._thread.join(timeout=timeout)
+        self.flush(max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        pending = self.pending()
+        with self._lock:
+            return {**self._stats, "pending": pending, "backoff_seconds": self._backoff}
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self._backoff or self.interval)
+            self._wake.clear()
+            if self._closed:
+                return
+
+            try:
+                while self.replay_batch() == self.batch_size and not self._closed:
+                    # Full batch: there is probably more, keep draining
+                    pass
+                self._backoff = 0.0
+            except Exception as e:
+                self._backoff = min(self.max_backoff, max(self.min_backoff, self._backoff * 2))
+                # Jitter so many processes don't retry in lockstep
+                self._backoff *= random.uniform(0.8, 1.2)
+                print(f"⚠️ {self.name}: replay failed, retrying in {self._backoff:.1f}s: {e}")
@@ -0,0 +1,147 @@
+"""
+Coalescing write-behind buffer.
+
+Callers put (key, value) pairs and return immediately. Only the latest value
+per key is kept; a single background thread hands the pending values to a
+flush function every flush_interval_ms, or sooner once max_batch keys are
+waiting. The buffer is bounded: when max_pending keys are waiting, put()
+blocks until the flusher catches up.
+
+stats() reports queue depth (current and peak) and flush latency (last, max
+and mean milliseconds) for sizing the buffer under load.
+"""
+import threading
+import time
+
+
+class CoalescingWriteBuffer:
+    def __init__(self, flush_fn, flush_interval_ms=500, max_batch=50, max_pending=1000, name="write-buffer"):
+        """
+        Parameters:
+        - flush_fn: called with a {key: value} dict; raising keeps the batch pending
+        - flush_interval_ms: longest time a value waits before being flushed
+        - max_batch: number of pending keys that triggers an early flush
+        - max_pending: number of pending keys at which put() starts blocking
+        """
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.name = name
+
+        self._pending = {}
+        self._cond = threading.Condition()
+        # Serialises swap + flush_fn so two flushes never reorder writes to a key
+        self._flush_lock = threading.Lock()
+        self._closed = False
+
+        self._stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "flushes": 0,
+            "flushed": 0,
+            "failed_flushes": 0,
+            "blocked_puts": 0,
+            "peak_pending": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, key, value, timeout=None):
+        """
+        Queue value for key, replacing any value still waiting for that key.
+
+        Returns:
+        - True once queued, False if the buffer stayed full for timeout seconds
+        """
+        with self._cond:
+            if key in self._pending:
+                self._pending[key] = value
+                self._stats["enqueued"] += 1
+                self._stats["coalesced"] += 1
+                return True
+
+            if len(self._pending) >= self.max_pending:
+                self._stats["blocked_puts"] += 1
+                self._cond.notify_all()
+                has_room = self._cond.wait_for(
+                    lambda: len(self._pending) < self.max_pending or self._closed,
+                    timeout=timeout,
+                )
+                if not has_room:
+                    return False
+
+            self._pending[key] = value
+            self._stats["enqueued"] += 1
+            self._stats["peak_pending"] = max(self._stats["peak_pending"], len(self._pending))
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+            return True
+
+    def flush(self):
+        """Synchronously write everything queued so far. Returns the number of keys flushed."""
+        with self._flush_lock:
+            with self._cond:
+                batch = self._pending
+                self._pending = {}
+                self._cond.notify_all()
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self.flush_fn(batch)
+            except Exception:
+                with self._cond:
+                    self._stats["failed_flushes"] += 1
+                    # Keep anything newer that arrived while we were flushing
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                raise
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._cond:
+                self._stats["flushes"] += 1
+                self._stats["flushed"] += len(batch)
+                self._stats["last_flush_ms"] = round(elapsed_ms, 3)
+                self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 3)
+                self._stats["total_flush_ms"] += elapsed_ms
+            return len(batch)
+
+    def close(self):
+        """Stop the flusher thread after a final flush."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            stats = {**self._stats, "pending": len(self._pending)}
+        stats["mean_flush_ms"] = round(stats["total_flush_ms"] / stats["flushes"], 3) if stats["flushes"] else 0.0
+        stats["total_flush_ms"] = round(stats["total_flush_ms"], 3)
+        return stats
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                trigger = min(self.max_batch, self.max_pending)
+                while not self._closed and len(self._pending) < trigger:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ {self.name}: flush failed, will retry: {e}")
+                time.sleep(self.flush_interval)